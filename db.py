@@ -1,60 +1,280 @@
 import sqlite3
 import os
 import json
+import logging
+import functools
+import threading
+from datetime import date, timedelta
 from pathlib import Path
 from scrapers.base import ProductPrice
 
+log = logging.getLogger(__name__)
+
 DB_PATH = Path(os.environ.get("DB_PATH", "/tmp/retailscope.db"))
+CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", 20000))
+MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", 10))
+# Almacenamiento del historial para bases nuevas: "rows" (una fila por scrape) o "rle"
+# (solo cambios, en price_runs). Una base existente se cambia con `python db.py migrate-rle`.
+PRICE_STORAGE = os.environ.get("PRICE_STORAGE", "rows")
+# Los precios se guardan como enteros en la unidad mínima de la moneda; en CLP es el peso
+PRICE_SCALE = 1
+SCHEMA_VERSION = 2  # 2 = layout compacto (stores, días enteros, precios enteros)
+# Retención (python db.py prune, o PRUNE_AFTER_RUN=1 en main): filas crudas y price_daily viven
+# RETENTION_RAW_DAYS días; lo anterior pasa a agregados semanales y, pasados
+# RETENTION_WEEKLY_DAYS, a mensuales en price_rollup.
+RETENTION_RAW_DAYS = int(os.environ.get("RETENTION_RAW_DAYS", 365))
+RETENTION_WEEKLY_DAYS = int(os.environ.get("RETENTION_WEEKLY_DAYS", 730))
+RETENTION_RUN_DAYS = int(os.environ.get("RETENTION_RUN_DAYS", 30))  # ledger scrape_runs/scrape_tasks
+
+_local = threading.local()
 
 
 def conn():
+    """Conexión SQLite (WAL) reutilizada por thread; las escrituras van en `with conn() as c:`."""
+    c = getattr(_local, "conn", None)
+    if c is not None and _local.path == DB_PATH:
+        return c
+    close()
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    c = sqlite3.connect(DB_PATH)
+    c = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT)
     c.row_factory = sqlite3.Row
+    # Antes que WAL: solo aplica a una base vacía; una existente lo toma con `python db.py prune --vacuum`
+    c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    c.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    c.execute("PRAGMA foreign_keys=ON")
+    _local.conn, _local.path = c, DB_PATH
     return c
 
 
+def close():
+    """Cierra la conexión del thread actual, si tiene una."""
+    c = getattr(_local, "conn", None)
+    _local.conn = None
+    if c is not None:
+        c.close()
+
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        category TEXT DEFAULT '',
+        is_own INTEGER DEFAULT 0,
+        search_query TEXT DEFAULT '',
+        urls TEXT DEFAULT '{}',
+        active INTEGER DEFAULT 1,
+        created_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE INDEX IF NOT EXISTS idx_products_listing ON products(is_own DESC, name, id);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    -- Diccionario de tiendas: el historial guarda store_id en vez del nombre
+    CREATE TABLE IF NOT EXISTS stores (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    -- day = días desde 1970-01-01, precios en unidades mínimas (PRICE_SCALE), scraped_at = epoch
+    CREATE TABLE IF NOT EXISTS prices (
+        id INTEGER PRIMARY KEY,
+        product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+        day INTEGER NOT NULL,
+        store_id INTEGER NOT NULL REFERENCES stores(id),
+        price INTEGER,
+        original_price INTEGER,
+        url TEXT,
+        sku TEXT,
+        error TEXT,
+        scraped_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+    );
+    CREATE INDEX IF NOT EXISTS idx_prices_product_day ON prices(product_id, day);
+    CREATE INDEX IF NOT EXISTS idx_prices_day ON prices(day);
+    CREATE TABLE IF NOT EXISTS resolved_urls (
+        product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+        store_key TEXT NOT NULL,
+        url TEXT NOT NULL,
+        sku TEXT,
+        resolved_at TEXT DEFAULT (datetime('now')),
+        PRIMARY KEY (product_id, store_key)
+    );
+    -- Última fila del historial por (producto, tienda), mantenida por save_prices
+    CREATE TABLE IF NOT EXISTS latest_prices (
+        id INTEGER,
+        product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+        day INTEGER NOT NULL,
+        store_id INTEGER NOT NULL REFERENCES stores(id),
+        price INTEGER,
+        original_price INTEGER,
+        url TEXT,
+        sku TEXT,
+        error TEXT,
+        scraped_at INTEGER,
+        PRIMARY KEY (product_id, store_id)
+    );
+    -- Resumen diario del historial (solo filas con precio), mantenido por save_prices
+    CREATE TABLE IF NOT EXISTS price_daily (
+        product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+        store_id INTEGER NOT NULL REFERENCES stores(id),
+        day INTEGER NOT NULL,
+        min_price INTEGER,
+        max_price INTEGER,
+        last_price INTEGER,
+        min_original_price INTEGER,
+        samples INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (product_id, day, store_id)
+    ) WITHOUT ROWID;
+    -- Modo change-only: un intervalo [valid_from, valid_to] por estado de precio
+    CREATE TABLE IF NOT EXISTS price_runs (
+        id INTEGER PRIMARY KEY,
+        product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+        store_id INTEGER NOT NULL REFERENCES stores(id),
+        price INTEGER,
+        original_price INTEGER,
+        url TEXT,
+        sku TEXT,
+        error TEXT,
+        valid_from INTEGER NOT NULL,
+        valid_to INTEGER NOT NULL,
+        scraped_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+    );
+    CREATE INDEX IF NOT EXISTS idx_price_runs_product ON price_runs(product_id, store_id, valid_to);
+    -- Ledger de corridas: una fila por run y una por tarea (producto, tienda) con su estado.
+    -- status del run: running | partial (quedaron tareas pendientes) | interrupted | done
+    CREATE TABLE IF NOT EXISTS scrape_runs (
+        id INTEGER PRIMARY KEY,
+        mode TEXT NOT NULL DEFAULT 'full',
+        parent_run_id INTEGER,
+        status TEXT NOT NULL DEFAULT 'running',
+        started_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        finished_at INTEGER
+    );
+    -- status de la tarea: pending | ok | error
+    CREATE TABLE IF NOT EXISTS scrape_tasks (
+        run_id INTEGER NOT NULL REFERENCES scrape_runs(id) ON DELETE CASCADE,
+        product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+        store_key TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        error TEXT,
+        duration_ms INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated_at INTEGER,
+        PRIMARY KEY (run_id, product_id, store_key)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_scrape_tasks_status ON scrape_tasks(run_id, status);
+    -- Modo workers (worker.py): una tarea pendiente con lease vigente la tiene tomada un proceso;
+    -- al vencer lease_until vuelve a la cola, hasta WORKER_MAX_LEASES veces
+    CREATE TABLE IF NOT EXISTS scrape_leases (
+        run_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        store_key TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        lease_until INTEGER NOT NULL,
+        leases INTEGER NOT NULL DEFAULT 1,
+        PRIMARY KEY (run_id, product_id, store_key),
+        FOREIGN KEY (run_id, product_id, store_key)
+            REFERENCES scrape_tasks(run_id, product_id, store_key) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    -- Agenda por (producto, tienda) de los runs programados: prioridad e intervalo los calcula
+    -- scheduler.py, last_scraped/last_status los mantiene record_tasks
+    CREATE TABLE IF NOT EXISTS scrape_schedule (
+        product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+        store_key TEXT NOT NULL,
+        priority REAL NOT NULL DEFAULT 0,
+        interval_s INTEGER,
+        last_scraped INTEGER,
+        last_status TEXT,
+        PRIMARY KEY (product_id, store_key)
+    ) WITHOUT ROWID;
+    -- Catálogo visto en los listados del modo crawl: último precio por (tienda, SKU de la tienda)
+    CREATE TABLE IF NOT EXISTS store_listings (
+        store_id INTEGER NOT NULL REFERENCES stores(id),
+        sku TEXT NOT NULL,
+        name TEXT,
+        url TEXT,
+        price INTEGER,
+        original_price INTEGER,
+        day INTEGER NOT NULL,
+        scraped_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        PRIMARY KEY (store_id, sku)
+    ) WITHOUT ROWID;
+    -- Historial anterior a meta.history_horizon, agregado por semana o mes (day = primer día del período)
+    CREATE TABLE IF NOT EXISTS price_rollup (
+        product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+        store_id INTEGER NOT NULL REFERENCES stores(id),
+        period TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        min_price INTEGER,
+        max_price INTEGER,
+        last_price INTEGER,
+        min_original_price INTEGER,
+        samples INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (product_id, period, day, store_id)
+    ) WITHOUT ROWID;
+"""
+
+
 def init():
     c = conn()
-    c.executescript("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            category TEXT DEFAULT '',
-            is_own INTEGER DEFAULT 0,
-            search_query TEXT DEFAULT '',
-            urls TEXT DEFAULT '{}',
-            active INTEGER DEFAULT 1,
-            created_at TEXT DEFAULT (datetime('now'))
-        );
-        CREATE TABLE IF NOT EXISTS prices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
-            date TEXT NOT NULL,
-            store TEXT NOT NULL,
-            price REAL,
-            original_price REAL,
-            url TEXT,
-            sku TEXT,
-            error TEXT,
-            scraped_at TEXT DEFAULT (datetime('now'))
-        );
-        CREATE INDEX IF NOT EXISTS idx_prices_product_date ON prices(product_id, date);
-        CREATE INDEX IF NOT EXISTS idx_prices_date ON prices(date);
-    """)
+    if _is_legacy_schema(c):
+        migrate_to_compact()
+    c.executescript(_SCHEMA)
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('storage', ?)", (PRICE_STORAGE,))
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
     c.commit()
-    c.close()
+    if not c.execute("SELECT EXISTS(SELECT 1 FROM latest_prices)").fetchone()[0]:
+        backfill_latest_prices()
+    if not c.execute("SELECT EXISTS(SELECT 1 FROM price_daily)").fetchone()[0]:
+        backfill_price_daily()
+
+
+def data_version() -> int:
+    """Contador que sube con cada escritura de precios o productos; sirve de ETag para la API."""
+    row = conn().execute("SELECT value FROM meta WHERE key='data_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _bump_version(c: sqlite3.Connection):
+    c.execute("""
+        INSERT INTO meta (key, value) VALUES ('data_version', '1')
+        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+    """)
 
 
 # ── Products ──────────────────────────────────────────────
-def get_products(active_only=True) -> list[dict]:
+def get_products(active_only=True, is_own: bool = None, category: str = None, store: str = None,
+                 after: tuple = None, limit: int = None) -> list[dict]:
+    """Productos en orden (is_own DESC, name, id), paginados por keyset: `after` es la clave del último
+    de la página anterior. `store` deja solo los que tienen precio vigente en esa tienda."""
     c = conn()
-    q = "SELECT * FROM products"
+    q, where, params = "SELECT * FROM products", [], []
     if active_only:
-        q += " WHERE active=1"
-    q += " ORDER BY is_own DESC, name"
-    rows = [dict(r) for r in c.execute(q).fetchall()]
-    c.close()
+        where.append("active=1")
+    if is_own is not None:
+        where.append("is_own=?")
+        params.append(int(is_own))
+    if category:
+        where.append("category=?")
+        params.append(category)
+    if store:
+        where.append("""EXISTS (SELECT 1 FROM latest_prices l JOIN stores s ON s.id=l.store_id
+                        WHERE l.product_id=products.id AND s.name=? AND l.price IS NOT NULL)""")
+        params.append(store)
+    if after:
+        own, name, pid = after
+        where.append("(is_own < ? OR (is_own = ? AND (name, id) > (?, ?)))")
+        params += [own, own, name, pid]
+    if where:
+        q += " WHERE " + " AND ".join(where)
+    q += " ORDER BY is_own DESC, name, id"
+    if limit:
+        q += " LIMIT ?"
+        params.append(limit)
+    rows = [dict(r) for r in c.execute(q, params).fetchall()]
     for r in rows:
         r["urls"] = json.loads(r.get("urls") or "{}")
     return rows
@@ -63,7 +283,6 @@ def get_products(active_only=True) -> list[dict]:
 def get_product(pid: int) -> dict | None:
     c = conn()
     row = c.execute("SELECT * FROM products WHERE id=?", (pid,)).fetchone()
-    c.close()
     if not row:
         return None
     r = dict(row)
@@ -73,14 +292,13 @@ def get_product(pid: int) -> dict | None:
 
 def add_product(name: str, category: str = "", is_own: bool = False,
                 search_query: str = "", urls: dict = None) -> int:
-    c = conn()
-    cur = c.execute(
-        "INSERT INTO products (name, category, is_own, search_query, urls) VALUES (?,?,?,?,?)",
-        (name, category, int(is_own), search_query, json.dumps(urls or {}))
-    )
-    pid = cur.lastrowid
-    c.commit()
-    c.close()
+    with conn() as c:
+        cur = c.execute(
+            "INSERT INTO products (name, category, is_own, search_query, urls) VALUES (?,?,?,?,?)",
+            (name, category, int(is_own), search_query, json.dumps(urls or {}))
+        )
+        pid = cur.lastrowid
+        _bump_version(c)
     return pid
 
 
@@ -90,59 +308,391 @@ def update_product(pid: int, **fields):
     if "is_own" in fields:
         fields["is_own"] = int(fields["is_own"])
     sets = ", ".join(f"{k}=?" for k in fields)
-    c = conn()
-    c.execute(f"UPDATE products SET {sets} WHERE id=?", (*fields.values(), pid))
-    c.commit()
-    c.close()
+    with conn() as c:
+        c.execute(f"UPDATE products SET {sets} WHERE id=?", (*fields.values(), pid))
+        if "search_query" in fields or "urls" in fields:
+            c.execute("DELETE FROM resolved_urls WHERE product_id=?", (pid,))
+        _bump_version(c)
 
 
 def delete_product(pid: int):
+    with conn() as c:
+        c.execute("DELETE FROM resolved_urls WHERE product_id=?", (pid,))
+        c.execute("DELETE FROM products WHERE id=?", (pid,))
+        _bump_version(c)
+
+
+# ── Resolved search URLs ──────────────────────────────────
+def get_resolutions(max_age_days: int = 30) -> dict[tuple[int, str], dict]:
+    """URL/SKU encontrados por búsqueda, por (product_id, store_key), más nuevos que max_age_days."""
     c = conn()
-    c.execute("DELETE FROM products WHERE id=?", (pid,))
-    c.commit()
-    c.close()
+    rows = c.execute(
+        "SELECT * FROM resolved_urls WHERE resolved_at >= datetime('now', ?)",
+        (f"-{max_age_days} days",)
+    ).fetchall()
+    return {(r["product_id"], r["store_key"]): dict(r) for r in rows}
+
+
+def save_resolution(product_id: int, store_key: str, url: str, sku: str = None):
+    with conn() as c:
+        c.execute("""
+            INSERT INTO resolved_urls (product_id, store_key, url, sku) VALUES (?,?,?,?)
+            ON CONFLICT(product_id, store_key) DO UPDATE SET
+                url=excluded.url, sku=excluded.sku, resolved_at=datetime('now')
+        """, (product_id, store_key, url, sku))
+
+
+def delete_resolutions(product_id: int = None, store_key: str = None):
+    """Olvida resoluciones: todas, las de un producto o la de un (producto, tienda)."""
+    q, params = "DELETE FROM resolved_urls WHERE 1=1", []
+    if product_id is not None:
+        q += " AND product_id=?"
+        params.append(product_id)
+    if store_key is not None:
+        q += " AND store_key=?"
+        params.append(store_key)
+    with conn() as c:
+        c.execute(q, params)
 
 
 # ── Prices ────────────────────────────────────────────────
+_EPOCH = date(1970, 1, 1).toordinal()
+_LATEST_COLUMNS = "id, product_id, day, store_id, price, original_price, url, sku, error, scraped_at"
+_store_ids: dict[tuple[Path, str], int] = {}
+
+
+def _day(d: str) -> int:
+    return date.fromisoformat(d).toordinal() - _EPOCH
+
+
+def _since(days: int) -> int:
+    return _day(str(date.today() - timedelta(days=days)))
+
+
+def _money(v: float | None) -> int | None:
+    return None if v is None else int(round(v * PRICE_SCALE))
+
+
+@functools.lru_cache(maxsize=4096)
+def _date_str(day: int) -> str:
+    return date.fromordinal(day + _EPOCH).isoformat()
+
+
+def _price(v: int | None) -> float | None:
+    return None if v is None else v / PRICE_SCALE
+
+
+def _store_names(c: sqlite3.Connection) -> dict[int, str]:
+    return {r[0]: r[1] for r in c.execute("SELECT id, name FROM stores")}
+
+
+def _date_sql(col: str) -> str:
+    return f"date({col} + 2440587.5)"  # día entero -> 'YYYY-MM-DD' (vía día juliano)
+
+
+def _money_sql(col: str) -> str:
+    return f"{col} * 1.0 / {PRICE_SCALE}"
+
+
+def _price_row_sql(t: str) -> str:
+    """Columnas compactas de la tabla `t` (unida a stores como s) con la forma pública de una fila de precio."""
+    return (f"{t}.id, {t}.product_id, {_date_sql(t + '.day')} AS date, s.name AS store, "
+            f"{_money_sql(t + '.price')} AS price, {_money_sql(t + '.original_price')} AS original_price, "
+            f"{t}.url, {t}.sku, {t}.error, datetime({t}.scraped_at, 'unixepoch') AS scraped_at")
+
+
+def _store_id(c: sqlite3.Connection, name: str) -> int:
+    key = (DB_PATH, name)
+    if key not in _store_ids:
+        c.execute("INSERT OR IGNORE INTO stores (name) VALUES (?)", (name,))
+        _store_ids[key] = c.execute("SELECT id FROM stores WHERE name=?", (name,)).fetchone()[0]
+    return _store_ids[key]
+
+
+def storage_mode(c: sqlite3.Connection = None) -> str:
+    row = (c or conn()).execute("SELECT value FROM meta WHERE key='storage'").fetchone()
+    return row[0] if row else "rows"
+
+
+def _history_sql(c: sqlite3.Connection) -> str:
+    """Subquery con las columnas de `prices` sobre el almacenamiento activo (en rle, day = valid_to)."""
+    if storage_mode(c) == "rle":
+        return ("SELECT id, product_id, valid_to AS day, store_id, price, original_price, url, sku, error, scraped_at "
+                "FROM price_runs")
+    return "SELECT * FROM prices"
+
+
+def _horizon(c: sqlite3.Connection) -> int:
+    """Primer día con detalle diario; lo anterior solo existe en price_rollup."""
+    row = c.execute("SELECT value FROM meta WHERE key='history_horizon'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _same_state(current, price: int | None, original: int | None, error: str | None) -> bool:
+    return (current["price"] == price and current["original_price"] == original
+            and (current["error"] is None) == (error is None))
+
+
 def save_prices(product_id: int, prices: list[ProductPrice]):
+    save_prices_many([(product_id, prices)])
+
+
+def save_prices_many(batch: list[tuple[int, list[ProductPrice]]], tasks: list[tuple] = None):
+    """Guarda los precios de varios productos en una sola transacción (un solo commit). `tasks`
+    son resultados del ledger (ver record_tasks) que quedan confirmados junto con sus precios."""
+    try:
+        with conn() as c:
+            rle = storage_mode(c) == "rle"
+            for product_id, prices in batch:
+                _save_product_prices(c, product_id, prices, rle)
+            if tasks:
+                record_tasks(tasks, c)
+            _bump_version(c)
+    except Exception:
+        _store_ids.clear()  # el rollback pudo deshacer tiendas recién insertadas
+        raise
+
+
+def _save_product_prices(c: sqlite3.Connection, product_id: int, prices: list[ProductPrice], rle: bool):
+    for p in prices:
+        row = (product_id, _day(p.date), _store_id(c, p.store), _money(p.price), _money(p.original_price),
+               p.url, p.sku, p.error)
+        if rle:
+            row_id = _save_run(c, row)
+        else:
+            row_id = c.execute("""
+                INSERT INTO prices (product_id, day, store_id, price, original_price, url, sku, error)
+                VALUES (?,?,?,?,?,?,?,?)
+            """, row).lastrowid
+        c.execute(f"""
+            INSERT INTO latest_prices ({_LATEST_COLUMNS})
+            VALUES (?,?,?,?,?,?,?,?,?, CAST(strftime('%s', 'now') AS INTEGER))
+            ON CONFLICT(product_id, store_id) DO UPDATE SET
+                id=excluded.id, day=excluded.day, price=excluded.price,
+                original_price=excluded.original_price, url=excluded.url, sku=excluded.sku,
+                error=excluded.error, scraped_at=excluded.scraped_at
+            WHERE excluded.day >= latest_prices.day
+        """, (row_id, *row))
+        if p.price is not None:
+            _, day, store_id, price, original = row[:5]
+            c.execute(_DAILY_UPSERT, (product_id, store_id, day, price, price, price, original, 1))
+
+
+def _save_run(c: sqlite3.Connection, row: tuple) -> int:
+    """Extiende el intervalo vigente si el estado no cambió; si cambió, abre uno nuevo."""
+    product_id, day, store_id, price, original, url, sku, error = row
+    current = c.execute(
+        "SELECT id, day, price, original_price, error FROM latest_prices WHERE product_id=? AND store_id=?",
+        (product_id, store_id)
+    ).fetchone()
+    if current and day >= current["day"] and _same_state(current, price, original, error):
+        c.execute("""
+            UPDATE price_runs SET valid_to=MAX(valid_to, ?), url=?, sku=?, error=?,
+                scraped_at=CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE id=?
+        """, (day, url, sku, error, current["id"]))
+        return current["id"]
+    return c.execute("""
+        INSERT INTO price_runs (product_id, store_id, price, original_price, url, sku, error, valid_from, valid_to)
+        VALUES (?,?,?,?,?,?,?,?,?)
+    """, (product_id, store_id, price, original, url, sku, error, day, day)).lastrowid
+
+
+# MIN()/MAX() escalares de SQLite devuelven NULL si un argumento es NULL, de ahí los COALESCE
+_DAILY_UPSERT = """
+    INSERT INTO price_daily (product_id, store_id, day, min_price, max_price, last_price, min_original_price, samples)
+    VALUES (?,?,?,?,?,?,?,?)
+    ON CONFLICT(product_id, day, store_id) DO UPDATE SET
+        min_price=COALESCE(MIN(min_price, excluded.min_price), min_price, excluded.min_price),
+        max_price=COALESCE(MAX(max_price, excluded.max_price), max_price, excluded.max_price),
+        last_price=excluded.last_price,
+        min_original_price=COALESCE(MIN(min_original_price, excluded.min_original_price),
+                                    min_original_price, excluded.min_original_price),
+        samples=samples + excluded.samples
+"""
+
+
+def backfill_price_daily() -> int:
+    """Reconstruye price_daily completo desde el historial. Devuelve las filas escritas.
+    En modo rle cada intervalo aporta un día por cada fecha entre valid_from y valid_to."""
+    with conn() as c:
+        c.execute("DELETE FROM price_daily")
+        horizon = _horizon(c)  # los días anteriores ya están agregados en price_rollup
+        if storage_mode(c) == "rle":
+            cur = c.execute("""
+                INSERT INTO price_daily (product_id, store_id, day, min_price, max_price, last_price, min_original_price, samples)
+                WITH RECURSIVE days(product_id, store_id, day, valid_to, price, original_price) AS (
+                    SELECT product_id, store_id, MAX(valid_from, :horizon), valid_to, price, original_price
+                    FROM price_runs WHERE price IS NOT NULL AND valid_to >= :horizon
+                    UNION ALL
+                    SELECT product_id, store_id, day + 1, valid_to, price, original_price
+                    FROM days WHERE day < valid_to
+                )
+                SELECT product_id, store_id, day, MIN(price), MAX(price), MAX(price), MIN(original_price), COUNT(*)
+                FROM days GROUP BY product_id, store_id, day
+            """, {"horizon": horizon})
+        else:
+            cur = c.execute("""
+                INSERT INTO price_daily (product_id, store_id, day, min_price, max_price, last_price, min_original_price, samples)
+                SELECT product_id, store_id, day, MIN(price), MAX(price),
+                       (SELECT p2.price FROM prices p2
+                        WHERE p2.product_id=p.product_id AND p2.store_id=p.store_id AND p2.day=p.day AND p2.price IS NOT NULL
+                        ORDER BY p2.id DESC LIMIT 1),
+                       MIN(original_price), COUNT(*)
+                FROM prices p WHERE price IS NOT NULL AND day >= ?
+                GROUP BY product_id, store_id, day
+            """, (horizon,))
+        _bump_version(c)  # cambian los historiales servidos: invalida los ETag
+    return cur.rowcount
+
+
+def _latest_from_history_sql(c: sqlite3.Connection) -> str:
+    """Fila más reciente por (producto, tienda), calculada desde el historial."""
+    return f"""
+        SELECT {_LATEST_COLUMNS} FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY product_id, store_id ORDER BY day DESC, id DESC) AS rn
+            FROM ({_history_sql(c)})
+        ) WHERE rn = 1
+    """
+
+
+def backfill_latest_prices() -> int:
+    """Reconstruye latest_prices completo desde el historial. Devuelve las filas escritas."""
+    with conn() as c:
+        c.execute("DELETE FROM latest_prices")
+        cur = c.execute(f"INSERT INTO latest_prices ({_LATEST_COLUMNS}) {_latest_from_history_sql(c)}")
+        _bump_version(c)
+    return cur.rowcount
+
+
+def check_latest_prices() -> list[dict]:
+    """Diferencias entre latest_prices y lo que dice el historial (vacío = consistente)."""
     c = conn()
-    c.executemany("""
-        INSERT INTO prices (product_id, date, store, price, original_price, url, sku, error)
-        VALUES (?,?,?,?,?,?,?,?)
-    """, [(product_id, p.date, p.store, p.price, p.original_price, p.url, p.sku, p.error)
-          for p in prices])
-    c.commit()
-    c.close()
+    rows = c.execute(f"""
+        WITH expected AS ({_latest_from_history_sql(c)})
+        SELECT e.product_id, s.name AS store, e.id AS expected_id, l.id AS actual_id
+        FROM expected e
+        LEFT JOIN latest_prices l ON l.product_id=e.product_id AND l.store_id=e.store_id
+        JOIN stores s ON s.id=e.store_id
+        WHERE l.id IS NOT e.id
+        UNION ALL
+        SELECT l.product_id, s.name, NULL, l.id
+        FROM latest_prices l
+        LEFT JOIN expected e ON l.product_id=e.product_id AND l.store_id=e.store_id
+        JOIN stores s ON s.id=l.store_id
+        WHERE e.id IS NULL
+    """).fetchall()
+    return [dict(r) for r in rows]
 
 
 def get_latest_prices(product_id: int) -> list[dict]:
+    return get_latest_prices_bulk([product_id]).get(product_id, [])
+
+
+def get_latest_prices_bulk(product_ids: list[int]) -> dict[int, list[dict]]:
+    """Últimos precios de muchos productos en una sola query: {product_id: [filas]}."""
     c = conn()
-    rows = c.execute("""
-        SELECT p1.* FROM prices p1
-        INNER JOIN (
-            SELECT store, MAX(date) as md FROM prices WHERE product_id=? GROUP BY store
-        ) p2 ON p1.store=p2.store AND p1.date=p2.md AND p1.product_id=?
-        WHERE p1.price IS NOT NULL
-        ORDER BY p1.price
-    """, (product_id, product_id)).fetchall()
-    c.close()
-    return [dict(r) for r in rows]
+    stores = _store_names(c)
+    rows = c.execute(f"""
+        SELECT id, product_id, day, store_id, price, original_price, url, sku, error,
+               datetime(scraped_at, 'unixepoch') AS scraped_at
+        FROM latest_prices
+        WHERE product_id IN (SELECT value FROM json_each(?)) AND price IS NOT NULL
+        ORDER BY product_id, price
+    """, (json.dumps(list(product_ids)),)).fetchall()
+    out: dict[int, list[dict]] = {}
+    for r in rows:
+        out.setdefault(r["product_id"], []).append({
+            "id": r["id"], "product_id": r["product_id"], "date": _date_str(r["day"]),
+            "store": stores[r["store_id"]], "price": _price(r["price"]),
+            "original_price": _price(r["original_price"]), "url": r["url"], "sku": r["sku"],
+            "error": r["error"], "scraped_at": r["scraped_at"],
+        })
+    return out
+
+
+def get_price_history(product_id: int, store: str = None, days: int = 90, columnar: bool = False) -> list[dict] | dict:
+    empty = {"dates": [], "series": {}} if columnar else []
+    return get_price_history_bulk([product_id], store=store, days=days, columnar=columnar).get(product_id, empty)
 
 
-def get_price_history(product_id: int, store: str = None, days: int = 90) -> list[dict]:
+def get_price_history_bulk(product_ids: list[int], store: str = None, days: int = 90,
+                           columnar: bool = False) -> dict[int, list[dict] | dict]:
+    """Historial diario de muchos productos en una sola query: {product_id: [filas]}, o por columnas
+    con `columnar`. Lo anterior a la retención sale de price_rollup."""
     c = conn()
-    q = """
-        SELECT date, store, MIN(price) as price, MIN(original_price) as original_price
-        FROM prices
-        WHERE product_id=? AND date >= date('now', ?) AND price IS NOT NULL
+    stores = _store_names(c)
+    # Lectura: una tienda que nunca se guardó no tiene historial (no se da de alta como en _store_id)
+    store_id = next((i for i, name in stores.items() if name == store), None)
+    if store and store_id is None:
+        return {}
+    ids, since, horizon = json.dumps(list(product_ids)), _since(days), _horizon(c)
+    store_filter = " AND store_id=?" if store else ""
+    q = f"""
+        SELECT product_id, day, store_id, min_price, min_original_price FROM price_daily
+        WHERE product_id IN (SELECT value FROM json_each(?)) AND day >= ?{store_filter}
+    """
+    params = [ids, since]
+    if store:
+        params.append(store_id)
+    if since < horizon:
+        q += f"""
+            UNION ALL
+            SELECT product_id, day, store_id, min_price, min_original_price FROM price_rollup
+            WHERE product_id IN (SELECT value FROM json_each(?)) AND day < ?
+              AND day > ? - CASE period WHEN 'week' THEN 7 ELSE 31 END{store_filter}
+        """
+        params += [ids, horizon, since]
+        if store:
+            params.append(store_id)
+    q += " ORDER BY product_id, day, store_id"
+    if columnar:
+        return _columnar_history(c.execute(q, params), stores)
+    out: dict[int, list[dict]] = {}
+    for product_id, day, store_id, price, original in c.execute(q, params):
+        out.setdefault(product_id, []).append({
+            "date": _date_str(day), "store": stores[store_id],
+            "price": _price(price), "original_price": _price(original),
+        })
+    return out
+
+
+def _columnar_history(rows, stores: dict[int, str]) -> dict[int, dict]:
+    """Filas ordenadas por (product_id, day) a un eje de fechas compartido por producto y una
+    serie densa por tienda, con None donde la tienda no tuvo precio ese día."""
+    out: dict[int, dict] = {}
+    last: dict[int, int] = {}
+    for product_id, day, store_id, price, _ in rows:
+        h = out.get(product_id)
+        if h is None:
+            h = out[product_id] = {"dates": [], "series": {}}
+        dates = h["dates"]
+        if last.get(product_id) != day:
+            dates.append(_date_str(day))
+            last[product_id] = day
+        series = h["series"].setdefault(stores[store_id], [])
+        series.extend([None] * (len(dates) - 1 - len(series)))
+        series.append(_price(price))
+    for h in out.values():
+        n = len(h["dates"])
+        for series in h["series"].values():
+            series.extend([None] * (n - len(series)))
+    return out
+
+
+def get_raw_prices(product_id: int, store: str = None, days: int = 7) -> list[dict]:
+    """Filas crudas (todas las corridas, incluidos errores) para ver el detalle. En modo rle
+    son los intervalos, con date = valid_to."""
+    c = conn()
+    q = f"""
+        SELECT {_price_row_sql("h")} FROM ({_history_sql(c)}) h JOIN stores s ON s.id=h.store_id
+        WHERE h.product_id=? AND h.day >= ?
     """
-    params = [product_id, f"-{days} days"]
+    params = [product_id, _since(days)]
     if store:
-        q += " AND store=?"
+        q += " AND s.name=?"
         params.append(store)
-    q += " GROUP BY date, store ORDER BY date"
-    rows = c.execute(q, params).fetchall()
-    c.close()
+    rows = c.execute(q + " ORDER BY h.day, h.id", params).fetchall()
     return [dict(r) for r in rows]
 
 
@@ -152,35 +702,487 @@ def get_dashboard_stats() -> dict:
         "total_products": c.execute("SELECT COUNT(*) FROM products WHERE active=1").fetchone()[0],
         "own_products": c.execute("SELECT COUNT(*) FROM products WHERE active=1 AND is_own=1").fetchone()[0],
         "competitor_products": c.execute("SELECT COUNT(*) FROM products WHERE active=1 AND is_own=0").fetchone()[0],
-        "last_scrape": c.execute("SELECT MAX(date) FROM prices").fetchone()[0],
-        "total_price_records": c.execute("SELECT COUNT(*) FROM prices").fetchone()[0],
+        "last_scrape": c.execute(f"SELECT {_date_sql('MAX(day)')} FROM latest_prices").fetchone()[0],
+        "total_price_records": c.execute(
+            f"SELECT COUNT(*) FROM {'price_runs' if storage_mode(c) == 'rle' else 'prices'}").fetchone()[0],
     }
-    c.close()
     return stats
 
 
 def get_categories() -> list[str]:
     c = conn()
     rows = c.execute("SELECT DISTINCT category FROM products WHERE category!='' ORDER BY category").fetchall()
-    c.close()
     return [r[0] for r in rows]
 
 
 def get_price_alerts(threshold_pct: float = 5.0) -> list[dict]:
     """Productos donde el precio bajó más de X% en las últimas 24h."""
     c = conn()
-    rows = c.execute("""
-        SELECT p.name, pr.store, pr.price as new_price, prev.price as old_price,
-               ROUND((1 - pr.price/prev.price)*100, 1) as drop_pct
-        FROM prices pr
-        JOIN prices prev ON pr.product_id=prev.product_id AND pr.store=prev.store
-            AND prev.date = date(pr.date, '-1 day')
+    rows = c.execute(f"""
+        SELECT p.name, s.name as store, {_money_sql("pr.last_price")} as new_price,
+               {_money_sql("prev.last_price")} as old_price,
+               ROUND((1 - pr.last_price * 1.0 / prev.last_price)*100, 1) as drop_pct
+        FROM price_daily pr
+        JOIN price_daily prev ON pr.product_id=prev.product_id AND pr.store_id=prev.store_id
+            AND prev.day = pr.day - 1
         JOIN products p ON p.id=pr.product_id
-        WHERE pr.date = date('now')
-          AND pr.price IS NOT NULL AND prev.price IS NOT NULL
-          AND pr.price < prev.price
-          AND (1 - pr.price/prev.price)*100 >= ?
+        JOIN stores s ON s.id=pr.store_id
+        WHERE pr.day = ?
+          AND pr.last_price < prev.last_price
+          AND (1 - pr.last_price * 1.0 / prev.last_price)*100 >= ?
         ORDER BY drop_pct DESC
-    """, (threshold_pct,)).fetchall()
-    c.close()
+    """, (_since(0), threshold_pct)).fetchall()
     return [dict(r) for r in rows]
+
+
+# ── Scrape runs ───────────────────────────────────────────
+def start_run(tasks: list[tuple[int, str]], mode: str = "full", parent_run_id: int = None) -> int:
+    """Abre un run con sus tareas (product_id, store_key) en pending. Un run anterior que quedó
+    en 'running' (el proceso murió) pasa a 'interrupted'."""
+    with conn() as c:
+        c.execute("UPDATE scrape_runs SET status='interrupted' WHERE status='running'")
+        run_id = c.execute("INSERT INTO scrape_runs (mode, parent_run_id) VALUES (?, ?)",
+                           (mode, parent_run_id)).lastrowid
+        c.executemany("INSERT OR IGNORE INTO scrape_tasks (run_id, product_id, store_key) VALUES (?,?,?)",
+                      [(run_id, pid, store_key) for pid, store_key in tasks])
+    return run_id
+
+
+def reopen_run(run_id: int):
+    with conn() as c:
+        c.execute("UPDATE scrape_runs SET status='interrupted' WHERE status='running' AND id != ?", (run_id,))
+        c.execute("UPDATE scrape_runs SET status='running', finished_at=NULL WHERE id=?", (run_id,))
+        c.execute("DELETE FROM scrape_leases WHERE run_id=?", (run_id,))  # los workers que las tenían ya no están
+
+
+def finish_run(run_id: int) -> str:
+    """Cierra el run: 'done' si no quedan tareas pendientes, si no 'partial' (se puede retomar)."""
+    with conn() as c:
+        pending = c.execute("SELECT EXISTS(SELECT 1 FROM scrape_tasks WHERE run_id=? AND status='pending')",
+                            (run_id,)).fetchone()[0]
+        status = "partial" if pending else "done"
+        c.execute("UPDATE scrape_runs SET status=?, finished_at=CAST(strftime('%s', 'now') AS INTEGER) WHERE id=?",
+                  (status, run_id))
+    return status
+
+
+def record_tasks(tasks: list[tuple], c: sqlite3.Connection = None):
+    """Resultados (run_id, product_id, store_key, status, error, duration_ms) de tareas del ledger;
+    también quedan como último scrape del par en scrape_schedule."""
+    q = """
+        INSERT INTO scrape_tasks (run_id, product_id, store_key, status, error, duration_ms, attempts, updated_at)
+        VALUES (?,?,?,?,?,?, 1, CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT(run_id, product_id, store_key) DO UPDATE SET
+            status=excluded.status, error=excluded.error, duration_ms=excluded.duration_ms,
+            attempts=attempts + 1, updated_at=excluded.updated_at
+    """
+    schedule = """
+        INSERT INTO scrape_schedule (product_id, store_key, last_scraped, last_status)
+        VALUES (?,?, CAST(strftime('%s', 'now') AS INTEGER), ?)
+        ON CONFLICT(product_id, store_key) DO UPDATE SET
+            last_scraped=excluded.last_scraped, last_status=excluded.last_status
+    """
+    if c is None:
+        with conn() as c:
+            return record_tasks(tasks, c)
+    c.executemany(q, tasks)
+    c.executemany(schedule, [(pid, store_key, status) for _, pid, store_key, status, *_ in tasks])
+
+
+def resumable_run() -> int | None:
+    """Último run que no terminó (interrumpido o con tareas pendientes)."""
+    row = conn().execute("SELECT id FROM scrape_runs WHERE status != 'done' ORDER BY id DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def last_run(finished: bool = True) -> int | None:
+    q = "SELECT id FROM scrape_runs"
+    if finished:
+        q += " WHERE finished_at IS NOT NULL"
+    row = conn().execute(q + " ORDER BY id DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def get_run_tasks(run_id: int, status: str = None) -> dict[int, set[str]]:
+    """Tareas de un run, opcionalmente filtradas por estado: {product_id: {store_key}}."""
+    q, params = "SELECT product_id, store_key FROM scrape_tasks WHERE run_id=?", [run_id]
+    if status:
+        q += " AND status=?"
+        params.append(status)
+    out: dict[int, set[str]] = {}
+    for pid, store_key in conn().execute(q, params):
+        out.setdefault(pid, set()).add(store_key)
+    return out
+
+
+def lease_tasks(run_id: int, owner: str, limit: int, lease_s: float, max_leases: int = 3) -> dict[int, set[str]]:
+    """Toma para `owner` hasta `limit` tareas pendientes libres o con lease vencido (hasta `max_leases`
+    veces) por `lease_s` segundos: {product_id: {store_key}}."""
+    with conn() as c:
+        rows = c.execute("""
+            INSERT INTO scrape_leases (run_id, product_id, store_key, owner, lease_until)
+            SELECT t.run_id, t.product_id, t.store_key, :owner, now.ts + :lease_s
+            FROM scrape_tasks t
+            CROSS JOIN (SELECT CAST(strftime('%s', 'now') AS INTEGER) AS ts) now
+            LEFT JOIN scrape_leases l
+                ON l.run_id = t.run_id AND l.product_id = t.product_id AND l.store_key = t.store_key
+            WHERE t.run_id = :run_id AND t.status = 'pending'
+              AND (l.run_id IS NULL OR (l.lease_until < now.ts AND l.leases < :max_leases))
+            ORDER BY t.product_id LIMIT :limit
+            ON CONFLICT(run_id, product_id, store_key) DO UPDATE SET
+                owner=excluded.owner, lease_until=excluded.lease_until, leases=leases + 1
+            RETURNING product_id, store_key
+        """, {"run_id": run_id, "owner": owner, "lease_s": round(lease_s), "limit": limit,
+              "max_leases": max_leases}).fetchall()
+    out: dict[int, set[str]] = {}
+    for pid, store_key in rows:
+        out.setdefault(pid, set()).add(store_key)
+    return out
+
+
+def leased_tasks(run_id: int) -> int:
+    """Tareas pendientes del run con un lease vigente (algún worker las está procesando)."""
+    return conn().execute("""
+        SELECT COUNT(*) FROM scrape_tasks t JOIN scrape_leases l
+            ON l.run_id = t.run_id AND l.product_id = t.product_id AND l.store_key = t.store_key
+        WHERE t.run_id = ? AND t.status = 'pending' AND l.lease_until >= CAST(strftime('%s', 'now') AS INTEGER)
+    """, (run_id,)).fetchone()[0]
+
+
+def run_products(run_id: int) -> int:
+    """Productos del run con alguna tarea terminada (ok o error), sin importar cuántos workers la tomaron."""
+    return conn().execute("SELECT COUNT(DISTINCT product_id) FROM scrape_tasks WHERE run_id=? AND status != 'pending'",
+                          (run_id,)).fetchone()[0]
+
+
+def get_runs(limit: int = 20) -> list[dict]:
+    rows = conn().execute("""
+        SELECT r.id, r.mode, r.parent_run_id, r.status,
+               datetime(r.started_at, 'unixepoch') AS started_at,
+               datetime(r.finished_at, 'unixepoch') AS finished_at,
+               COUNT(t.run_id) AS tasks,
+               COALESCE(SUM(t.status = 'ok'), 0) AS ok,
+               COALESCE(SUM(t.status = 'error'), 0) AS errors,
+               COALESCE(SUM(t.status = 'pending'), 0) AS pending
+        FROM scrape_runs r LEFT JOIN scrape_tasks t ON t.run_id = r.id
+        GROUP BY r.id ORDER BY r.id DESC LIMIT ?
+    """, (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def run_exists(run_id: int) -> bool:
+    return conn().execute("SELECT EXISTS(SELECT 1 FROM scrape_runs WHERE id=?)", (run_id,)).fetchone()[0] == 1
+
+
+def get_run_stats(run_id: int) -> list[dict]:
+    """Por tienda: tareas, ok, errores, pendientes y duración (total, promedio, máxima) en ms."""
+    rows = conn().execute("""
+        SELECT store_key, COUNT(*) AS tasks,
+               SUM(status = 'ok') AS ok, SUM(status = 'error') AS errors, SUM(status = 'pending') AS pending,
+               SUM(duration_ms) AS total_ms, CAST(AVG(duration_ms) AS INTEGER) AS avg_ms, MAX(duration_ms) AS max_ms
+        FROM scrape_tasks WHERE run_id=?
+        GROUP BY store_key ORDER BY store_key
+    """, (run_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+
+# ── Listings ──────────────────────────────────────────────
+def save_listings(store: str, items: list[ProductPrice]) -> int:
+    """Guarda una página de listado (modo crawl) como último precio visto por SKU de `store`."""
+    try:
+        with conn() as c:
+            store_id = _store_id(c, store)
+            return c.executemany("""
+                INSERT INTO store_listings (store_id, sku, name, url, price, original_price, day)
+                VALUES (?,?,?,?,?,?,?)
+                ON CONFLICT(store_id, sku) DO UPDATE SET
+                    name=excluded.name, url=excluded.url, price=excluded.price,
+                    original_price=excluded.original_price, day=excluded.day,
+                    scraped_at=CAST(strftime('%s', 'now') AS INTEGER)
+            """, [(store_id, p.sku, p.product_name, p.url, _money(p.price), _money(p.original_price), _day(p.date))
+                  for p in items if p.sku]).rowcount
+    except Exception:
+        _store_ids.clear()
+        raise
+
+
+def get_listings(store: str, skus: list[str], days: int = 0) -> dict[str, dict]:
+    """Lo visto en los listados de `store` en los últimos `days` días (0 = hoy) para esos SKUs."""
+    c = conn()
+    rows = c.execute(f"""
+        SELECT l.sku, l.name, l.url, {_money_sql("l.price")} AS price,
+               {_money_sql("l.original_price")} AS original_price, {_date_sql("l.day")} AS date
+        FROM store_listings l JOIN stores s ON s.id = l.store_id
+        WHERE s.name = ? AND l.sku IN (SELECT value FROM json_each(?)) AND l.day >= ?
+    """, (store, json.dumps(list(skus)), _since(days))).fetchall()
+    return {r["sku"]: dict(r) for r in rows}
+
+
+# ── Schedule ──────────────────────────────────────────────
+def get_schedule_signals(days: int = 30) -> dict[tuple[int, str], dict]:
+    """Por (producto, nombre de tienda): días con precio y con cambio de precio en los últimos `days`, y si está en promoción."""
+    rows = conn().execute("""
+        WITH d AS (
+            SELECT product_id, store_id, min_price, max_price, last_price,
+                   LAG(last_price) OVER (PARTITION BY product_id, store_id ORDER BY day) AS prev
+            FROM price_daily WHERE day >= ?
+        ), v AS (
+            SELECT product_id, store_id, COUNT(*) AS days,
+                   SUM(min_price != max_price OR (prev IS NOT NULL AND last_price != prev)) AS changes
+            FROM d GROUP BY product_id, store_id
+        )
+        SELECT l.product_id, s.name AS store, COALESCE(v.days, 0) AS days, COALESCE(v.changes, 0) AS changes,
+               COALESCE(l.price < l.original_price, 0) AS promo
+        FROM latest_prices l JOIN stores s ON s.id = l.store_id
+        LEFT JOIN v ON v.product_id = l.product_id AND v.store_id = l.store_id
+    """, (_since(days),)).fetchall()
+    return {(r["product_id"], r["store"]): {"days": r["days"], "changes": r["changes"], "promo": bool(r["promo"])}
+            for r in rows}
+
+
+def get_schedule() -> dict[tuple[int, str], dict]:
+    rows = conn().execute("SELECT * FROM scrape_schedule").fetchall()
+    return {(r["product_id"], r["store_key"]): dict(r) for r in rows}
+
+
+def update_schedule(rows: list[tuple[int, str, float, int]]):
+    """Guarda (product_id, store_key, priority, interval_s) sin tocar el último scrape."""
+    with conn() as c:
+        c.executemany("""
+            INSERT INTO scrape_schedule (product_id, store_key, priority, interval_s) VALUES (?,?,?,?)
+            ON CONFLICT(product_id, store_key) DO UPDATE SET
+                priority=excluded.priority, interval_s=excluded.interval_s
+        """, rows)
+
+
+# ── Retention ─────────────────────────────────────────────
+def _week_sql(col: str) -> str:
+    return f"({col} - ({col} + 3) % 7)"  # lunes de la semana (1970-01-01 fue jueves)
+
+
+def _month_sql(col: str) -> str:
+    return f"CAST(julianday({_date_sql(col)}, 'start of month') - 2440587.5 AS INTEGER)"
+
+
+def _rollup(c: sqlite3.Connection, period: str, bucket, source: str, where: str, params: tuple) -> int:
+    """Suma a price_rollup las filas de `source` que cumplen `where`, por período (`bucket` da su primer día)."""
+    return c.execute(f"""
+        INSERT INTO price_rollup (product_id, store_id, period, day, min_price, max_price, last_price,
+                                  min_original_price, samples)
+        SELECT product_id, store_id, '{period}', bucket, MIN(min_price), MAX(max_price),
+               MAX(CASE WHEN rn = 1 THEN last_price END), MIN(min_original_price), SUM(samples)
+        FROM (
+            SELECT *, {bucket("day")} AS bucket,
+                   ROW_NUMBER() OVER (PARTITION BY product_id, store_id, {bucket("day")} ORDER BY day DESC) AS rn
+            FROM {source} WHERE {where}
+        ) WHERE true
+        GROUP BY product_id, store_id, bucket
+        ON CONFLICT(product_id, period, day, store_id) DO UPDATE SET
+            min_price=COALESCE(MIN(min_price, excluded.min_price), min_price, excluded.min_price),
+            max_price=COALESCE(MAX(max_price, excluded.max_price), max_price, excluded.max_price),
+            last_price=excluded.last_price,
+            min_original_price=COALESCE(MIN(min_original_price, excluded.min_original_price),
+                                        min_original_price, excluded.min_original_price),
+            samples=samples + excluded.samples
+    """, params).rowcount
+
+
+def prune_history(raw_days: int = RETENTION_RAW_DAYS, weekly_days: int = RETENTION_WEEKLY_DAYS,
+                  vacuum: bool = True) -> dict:
+    """Aplica la retención (diario a semanas y meses, filas crudas, runs y listados viejos); devuelve lo hecho en cada paso."""
+    today = _since(0)
+    cutoff = today - raw_days
+    cutoff -= (cutoff + 3) % 7  # solo semanas completas
+    month_cutoff = date.fromordinal(today - weekly_days + _EPOCH).replace(day=1).toordinal() - _EPOCH
+    out = {"horizon": None, "daily_to_weekly": 0, "raw_deleted": 0, "weekly_to_monthly": 0, "runs_deleted": 0,
+           "listings_deleted": 0, "freed_pages": 0}
+    with conn() as c:
+        if cutoff > _horizon(c):
+            out["daily_to_weekly"] = _rollup(c, "week", _week_sql, "price_daily", "day < ?", (cutoff,))
+            c.execute("DELETE FROM price_daily WHERE day < ?", (cutoff,))
+            if storage_mode(c) == "rle":
+                q = "DELETE FROM price_runs WHERE valid_to < ? AND id NOT IN (SELECT id FROM latest_prices)"
+            else:
+                q = "DELETE FROM prices WHERE day < ? AND id NOT IN (SELECT id FROM latest_prices)"
+            out["raw_deleted"] = c.execute(q, (cutoff,)).rowcount
+            c.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('history_horizon', ?)", (str(cutoff),))
+        out["horizon"] = _date_str(_horizon(c))
+        out["weekly_to_monthly"] = _rollup(c, "month", _month_sql, "price_rollup",
+                                           "period = 'week' AND day < ?", (month_cutoff,))
+        c.execute("DELETE FROM price_rollup WHERE period = 'week' AND day < ?", (month_cutoff,))
+        if out["daily_to_weekly"] or out["weekly_to_monthly"] or out["raw_deleted"]:
+            _bump_version(c)
+        out["runs_deleted"] = c.execute(
+            "DELETE FROM scrape_runs WHERE started_at < CAST(strftime('%s', 'now') AS INTEGER) - ? * 86400",
+            (RETENTION_RUN_DAYS,)).rowcount
+        out["listings_deleted"] = c.execute("DELETE FROM store_listings WHERE day < ?",
+                                            (today - RETENTION_RUN_DAYS,)).rowcount
+    if vacuum:
+        out["freed_pages"] = incremental_vacuum()
+    log.info(f"Retención aplicada: {out}")
+    return out
+
+
+def incremental_vacuum() -> int:
+    """Devuelve al sistema las páginas libres del archivo. Requiere auto_vacuum=INCREMENTAL
+    (bases nuevas, o una existente después de un VACUUM completo). Devuelve las páginas liberadas."""
+    c = conn()
+    free = c.execute("PRAGMA freelist_count").fetchone()[0]
+    if c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        if free:
+            log.info(f"{free} páginas libres; corré `python db.py prune --vacuum` para activar incremental_vacuum")
+        return 0
+    c.executescript("PRAGMA incremental_vacuum")  # execute() solo avanza un paso del pragma
+    return free - c.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def migrate_to_rle(keep_raw: bool = False) -> int:
+    """Convierte el historial de prices en intervalos de price_runs (filas consecutivas con el
+    mismo precio, precio original y estado de error se funden) y activa el modo rle."""
+    with conn() as c:
+        if storage_mode(c) == "rle":
+            return 0
+        cur = c.execute("""
+            INSERT INTO price_runs (product_id, store_id, price, original_price, url, sku, error,
+                                    valid_from, valid_to, scraped_at)
+            SELECT p.product_id, p.store_id, p.price, p.original_price, p.url, p.sku, p.error,
+                   g.valid_from, g.valid_to, p.scraped_at
+            FROM (
+                SELECT product_id, store_id, MIN(day) AS valid_from, MAX(day) AS valid_to, MAX(id) AS last_id
+                FROM (
+                    SELECT *, SUM(changed) OVER (PARTITION BY product_id, store_id ORDER BY day, id) AS grp
+                    FROM (
+                        SELECT id, product_id, store_id, day,
+                               CASE WHEN LAG(id) OVER w IS NULL
+                                      OR price IS NOT LAG(price) OVER w
+                                      OR original_price IS NOT LAG(original_price) OVER w
+                                      OR (error IS NULL) != (LAG(error) OVER w IS NULL)
+                                    THEN 1 ELSE 0 END AS changed
+                        FROM prices
+                        WINDOW w AS (PARTITION BY product_id, store_id ORDER BY day, id)
+                    )
+                )
+                GROUP BY product_id, store_id, grp
+            ) g JOIN prices p ON p.id = g.last_id
+            ORDER BY g.product_id, g.store_id, g.valid_from
+        """)
+        runs = cur.rowcount
+        if not keep_raw:
+            c.execute("DELETE FROM prices")
+        c.execute("UPDATE meta SET value='rle' WHERE key='storage'")
+        _bump_version(c)
+    backfill_latest_prices()
+    return runs
+
+
+def _is_legacy_schema(c: sqlite3.Connection) -> bool:
+    """True si `prices` todavía tiene el layout original (store texto, date ISO, precio REAL)."""
+    cols = {r["name"] for r in c.execute("PRAGMA table_info(prices)")}
+    return "date" in cols
+
+
+def _statements(script: str) -> list[str]:
+    """Sentencias de un script SQL; no corta en los ";" de comentarios o strings."""
+    out, current = [], ""
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            out.append(current)
+            current = ""
+    return out
+
+
+def migrate_to_compact() -> dict:
+    """Migra el layout original (store texto, fechas ISO, precios REAL) al compacto; devuelve las filas por tabla."""
+    c = conn()
+    if not _is_legacy_schema(c):
+        return {}
+    log.warning("Migrando la base al layout compacto; puede tardar con historiales grandes")
+    tables = {r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    day = "CAST(julianday({}) - 2440587.5 AS INTEGER)"
+    money = f"CAST(ROUND({{}} * {PRICE_SCALE}) AS INTEGER)"
+    epoch = "CAST(strftime('%s', {}) AS INTEGER)"
+    counts = {}
+    c.execute("PRAGMA foreign_keys=OFF")
+    try:
+        with c:
+            c.execute("BEGIN")  # los ALTER/CREATE también quedan dentro de la transacción
+            for t in ("prices", "price_runs", "latest_prices", "price_daily"):
+                if t in tables:
+                    c.execute(f"ALTER TABLE {t} RENAME TO {t}_legacy")
+            for stmt in _statements(_SCHEMA):
+                c.execute(stmt)
+            sources = ["SELECT store FROM prices_legacy"]
+            if "price_runs" in tables:
+                sources.append("SELECT store FROM price_runs_legacy")
+            c.execute(f"INSERT OR IGNORE INTO stores (name) SELECT DISTINCT store FROM ({' UNION '.join(sources)})")
+            counts["prices"] = c.execute(f"""
+                INSERT INTO prices (id, product_id, day, store_id, price, original_price, url, sku, error, scraped_at)
+                SELECT p.id, p.product_id, {day.format("p.date")}, s.id, {money.format("p.price")},
+                       {money.format("p.original_price")}, p.url, p.sku, p.error, {epoch.format("p.scraped_at")}
+                FROM prices_legacy p JOIN stores s ON s.name=p.store
+            """).rowcount
+            if "price_runs" in tables:
+                counts["price_runs"] = c.execute(f"""
+                    INSERT INTO price_runs (id, product_id, store_id, price, original_price, url, sku, error,
+                                            valid_from, valid_to, scraped_at)
+                    SELECT r.id, r.product_id, s.id, {money.format("r.price")}, {money.format("r.original_price")},
+                           r.url, r.sku, r.error, {day.format("r.valid_from")}, {day.format("r.valid_to")},
+                           {epoch.format("r.scraped_at")}
+                    FROM price_runs_legacy r JOIN stores s ON s.name=r.store
+                """).rowcount
+            for t in ("prices", "price_runs", "latest_prices", "price_daily"):
+                c.execute(f"DROP TABLE IF EXISTS {t}_legacy")
+            c.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+    finally:
+        c.execute("PRAGMA foreign_keys=ON")
+    counts["latest_prices"] = backfill_latest_prices()
+    counts["price_daily"] = backfill_price_daily()
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de RetailScope")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    check = sub.add_parser("check-latest", help="Compara latest_prices con el historial de prices")
+    check.add_argument("--fix", action="store_true", help="Reconstruye latest_prices si hay diferencias")
+    sub.add_parser("rebuild-daily", help="Reconstruye price_daily desde el historial")
+    rle = sub.add_parser("migrate-rle", help="Pasa el historial a almacenamiento change-only (price_runs)")
+    rle.add_argument("--keep-raw", action="store_true", help="No borra las filas originales de prices")
+    sub.add_parser("migrate-compact", help="Migra el layout original al compacto y compacta el archivo")
+    prune = sub.add_parser("prune", help="Aplica la retención: agrega el historial antiguo por semana/mes")
+    prune.add_argument("--raw-days", type=int, default=RETENTION_RAW_DAYS, help="Días con detalle diario")
+    prune.add_argument("--weekly-days", type=int, default=RETENTION_WEEKLY_DAYS,
+                       help="Días con detalle semanal; lo anterior queda mensual")
+    prune.add_argument("--vacuum", action="store_true",
+                       help="VACUUM completo al final (activa auto_vacuum incremental en bases existentes)")
+    runs = sub.add_parser("runs", help="Lista los últimos runs o el detalle por tienda de uno")
+    runs.add_argument("run_id", nargs="?", type=int)
+    args = parser.parse_args()
+
+    if args.cmd == "migrate-compact":
+        print(migrate_to_compact() or "La base ya está en el layout compacto")
+        conn().execute("VACUUM")
+        raise SystemExit(0)
+    init()
+    if args.cmd == "check-latest":
+        diffs = check_latest_prices()
+        for d in diffs[:50]:
+            print(d)
+        print(f"{len(diffs)} diferencias")
+        if diffs and args.fix:
+            print(f"latest_prices reconstruida: {backfill_latest_prices()} filas")
+        raise SystemExit(1 if diffs and not args.fix else 0)
+    elif args.cmd == "rebuild-daily":
+        print(f"price_daily reconstruida: {backfill_price_daily()} filas")
+    elif args.cmd == "migrate-rle":
+        print(f"{migrate_to_rle(keep_raw=args.keep_raw)} intervalos escritos en price_runs")
+    elif args.cmd == "runs":
+        for r in (get_run_stats(args.run_id) if args.run_id else get_runs()):
+            print(r)
+    elif args.cmd == "prune":
+        print(prune_history(args.raw_days, args.weekly_days, vacuum=not args.vacuum))
+        if args.vacuum:
+            conn().execute("VACUUM")
@@ -1,82 +1,505 @@
+import os
+import time
 import asyncio
 import logging
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from datetime import date
-from scrapers import STORES
-from scrapers.base import ProductPrice
+from scrapers import STORES, store_settings
+from scrapers.base import ProductPrice, is_gone
+from scrapers import client, breaker
+from scrapers.singleflight import SingleFlight
+from sink import PriceSink
+import scheduler
 import db
 
 log = logging.getLogger(__name__)
 
+# Productos en vuelo al mismo tiempo
+PRODUCT_CONCURRENCY = int(os.environ.get("SCRAPE_CONCURRENCY", 8))
+# Usar scrape_urls(batch) en las tiendas que lo implementan
+BATCH_ENABLED = os.environ.get("SCRAPE_BATCH", "1") == "1"
+# Días que vale una URL encontrada por search_query antes de volver a buscar
+RESOLVE_TTL_DAYS = int(os.environ.get("RESOLVE_TTL_DAYS", 30))
+# Aplicar la retención del historial (db.prune_history) al terminar cada run
+PRUNE_AFTER_RUN = os.environ.get("PRUNE_AFTER_RUN", "0") == "1"
+# Modo crawl: recorrer listados completos a PAGE_SIZE productos por request, guardarlos por SKU
+# (store_listings) y tomar de ahí los precios de los productos seguidos. CRAWL_TARGETS =
+# "mercadolibre=cat:MLC1648,falabella=taladros"; sin definir, se busca cada categoría de
+# producto en todas las tiendas con listing()
+CRAWL_ENABLED = os.environ.get("SCRAPE_CRAWL", "0") == "1"
+CRAWL_TARGETS = os.environ.get("CRAWL_TARGETS", "")
+CRAWL_MAX_PAGES = int(os.environ.get("CRAWL_MAX_PAGES", 20))  # páginas por listado
 
-async def scrape_product(product: dict) -> list[ProductPrice]:
-    results = []
+
+def store_limits() -> dict[str, int]:
+    """Límite de concurrencia por tienda: CONCURRENCY del módulo, sobreescribible con
+    STORE_CONCURRENCY="mercadolibre=16,sodimac=2"."""
+    return store_settings("CONCURRENCY", "STORE_CONCURRENCY", default=4, cast=int)
+
+
+@dataclass
+class ScrapeRun:
+    """Estado compartido por todos los productos de un run."""
+    store_sems: dict[str, asyncio.Semaphore] = field(default_factory=dict)
+    prefetched: dict[tuple[int, str], ProductPrice] = field(default_factory=dict)
+    flights: SingleFlight = field(default_factory=SingleFlight)
+    # Tareas del ledger a correr {product_id: {store_key}}; None = todas las que correspondan
+    tasks: dict[int, set[str]] | None = None
+
+
+class RunProgress:
+    """Avance de un run para mostrarlo en vivo: cada producto cuenta al quedar guardado
+    (callback on_write del sink) y se emite como evento "product" vía `emit(event, data)`."""
+
+    def __init__(self, total: int, emit: Callable[[str, dict], None] = None):
+        self.total = total
+        self.done = 0
+        self.stores: dict[str, dict[str, int]] = {}
+        self.started = time.monotonic()
+        self.emit = emit
+
+    def snapshot(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        return {
+            "done": self.done,
+            "total": self.total,
+            "stores": {store: dict(counts) for store, counts in self.stores.items()},
+            "products_per_sec": round(rate, 2),
+            "eta_s": round((self.total - self.done) / rate, 1) if rate else None,
+        }
+
+    def product_written(self, product_id: int, prices: list[ProductPrice], saved: bool):
+        self.done += 1
+        for p in prices:
+            counts = self.stores.setdefault(p.store, {"ok": 0, "errors": 0})
+            if p.price is not None:
+                counts["ok"] += 1
+            if p.error:
+                counts["errors"] += 1
+        if self.emit:
+            self.emit("product", {**self.snapshot(), "product_id": product_id, "saved": saved,
+                                  "prices": sum(1 for p in prices if p.price is not None)})
+
+
+async def _limited(sem: asyncio.Semaphore | None, coro):
+    if sem is None:
+        return await coro
+    async with sem:
+        return await coro
+
+
+def planned_stores(product: dict, run: ScrapeRun) -> list[str]:
+    """Tiendas a scrapear para el producto: las que tienen URL (propia, resuelta o ya obtenida
+    por lote) y, si tiene search_query, todas; en un run retomado solo sus tareas pendientes."""
     urls = product.get("urls", {})
     query = product.get("search_query", "").strip()
-    name = product["name"]
+    allowed = run.tasks.get(product.get("id"), set()) if run.tasks is not None else None
+    return [store_key for store_key in STORES
+            if (allowed is None or store_key in allowed)
+            and ((product.get("id"), store_key) in run.prefetched or urls.get(store_key, "").strip() or query)]
 
-    tasks = []
-    store_keys = []
 
-    for store_key, module in STORES.items():
-        url = urls.get(store_key, "").strip()
-        if url:
-            tasks.append(module.scrape_url(url, name))
-            store_keys.append(store_key)
-        elif query:
-            tasks.append(_search_first(module, query, name))
-            store_keys.append(store_key)
+async def _timed(coro):
+    started = time.monotonic()
+    try:
+        result = await coro
+    except Exception as e:
+        result = e
+    return result, time.monotonic() - started
 
-    if tasks:
-        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
-        for outcome in outcomes:
+
+async def scrape_product(product: dict, run: ScrapeRun = None, report: list = None) -> list[ProductPrice]:
+    """Precios del producto en cada tienda. Si se pasa `report`, se le agrega por tienda
+    (store_key, "ok" | "error", error, duración en ms) para el ledger de scrape_tasks."""
+    results = []
+    name = product["name"]
+    run = run or ScrapeRun()
+
+    store_keys = planned_stores(product, run)
+    if store_keys:
+        outcomes = await asyncio.gather(*(_timed(_scrape_store(key, STORES[key], product, run)) for key in store_keys))
+        for store_key, (outcome, elapsed) in zip(store_keys, outcomes):
             if isinstance(outcome, Exception):
-                results.append(ProductPrice(store="unknown", product_name=name,
-                                            url="", price=None, error=str(outcome)))
-            elif isinstance(outcome, list):
-                results.extend(outcome)
-            else:
-                results.append(outcome)
+                outcome = ProductPrice(store=STORES[store_key].STORE, product_name=name,
+                                       url="", price=None, error=str(outcome))
+            found = outcome if isinstance(outcome, list) else [outcome]
+            results.extend(found)
+            if report is not None:
+                ok = any(p.price is not None for p in found)
+                error = None if ok else next((p.error for p in found if p.error), "Sin precio")
+                report.append((store_key, "ok" if ok else "error", error, round(elapsed * 1000)))
 
     return results
 
 
-async def _search_first(module, query: str, name: str) -> ProductPrice:
-    found = await module.search(query, limit=1)
+async def _scrape_store(store_key: str, module, product: dict, run: ScrapeRun) -> ProductPrice:
+    name = product["name"]
+    url = product.get("urls", {}).get(store_key, "").strip()
+    key = (product.get("id"), store_key)
+    if key in run.prefetched:
+        r = run.prefetched[key]
+    elif url:
+        sem = run.store_sems.get(store_key)
+        r = await run.flights.do(("url", store_key, url), lambda: _limited(sem, module.scrape_url(url, name)))
+        r = replace(r, product_name=name)
+    else:
+        return await _resolve(store_key, module, product, run)
+
+    if store_key in product.get("resolved_stores", ()) and is_gone(r.error):
+        # La URL que encontró una búsqueda anterior ya no existe: buscar de nuevo. Ante una falla
+        # pasajera (timeout, 5xx, circuito abierto) se mantiene, para no cambiar de publicación
+        log.info(f"  URL resuelta de {store_key} falló ({r.error}), buscando de nuevo")
+        db.delete_resolutions(product["id"], store_key)
+        return await _resolve(store_key, module, product, run)
+    return r
+
+
+async def _resolve(store_key: str, module, product: dict, run: ScrapeRun) -> ProductPrice:
+    query = product["search_query"].strip()
+    sem = run.store_sems.get(store_key)
+    found = await run.flights.do(("search", store_key, query, 1), lambda: _limited(sem, module.search(query, limit=1)))
+    r = _first(module, found, product["name"])
+    if product.get("id") and r.url and r.price is not None and not r.error:
+        db.save_resolution(product["id"], store_key, r.url, r.sku)
+    return r
+
+
+def with_resolutions(product: dict, resolutions: dict[tuple[int, str], dict]) -> dict:
+    """Copia del producto donde las tiendas sin URL propia usan la URL resuelta por una búsqueda previa."""
+    if not product.get("search_query", "").strip():
+        return product
+    urls = dict(product.get("urls", {}))
+    resolved = []
+    for store_key in STORES:
+        hit = resolutions.get((product["id"], store_key))
+        if hit and not urls.get(store_key, "").strip():
+            urls[store_key] = hit["url"]
+            resolved.append(store_key)
+    return {**product, "urls": urls, "resolved_stores": resolved} if resolved else product
+
+
+def _remember_skus(products: list[dict], run: ScrapeRun):
+    """Enseña a los módulos con remember (VTEX) el SKU guardado de cada URL, para que un proceso
+    recién arrancado (CLI, workers) consulte en lote sin resolver antes cada productId."""
+    stores = {key for product in products for key in planned_stores(product, run)
+              if hasattr(STORES[key], "remember")}
+    if not stores:
+        return
+    latest = db.get_latest_prices_bulk([p["id"] for p in products])
+    for product in products:
+        saved = {(r["store"], r["url"]): r["sku"] for r in latest.get(product["id"], []) if r.get("sku")}
+        for store_key in stores:
+            module = STORES[store_key]
+            url = product.get("urls", {}).get(store_key, "").strip()
+            if url and not module.sku_for(url) and (module.STORE, url) in saved:
+                module.remember(url, saved[(module.STORE, url)])
+
+
+async def scrape_batches(products: list[dict], run: ScrapeRun) -> dict[tuple[int, str], ProductPrice]:
+    """Agrupa por tienda las URLs de los módulos con scrape_urls y las consulta en lotes de
+    BATCH_SIZE. Devuelve {(product_id, store_key): ProductPrice}; lo que falte va por scrape_url."""
+    # store_key -> url -> [(product_id, product_name)]; una URL repetida se pide una sola vez
+    pending: dict[str, dict[str, list[tuple[int, str]]]] = {}
+    _remember_skus(products, run)
+    for product in products:
+        for store_key in planned_stores(product, run):
+            if (product["id"], store_key) in run.prefetched:
+                continue
+            module = STORES[store_key]
+            url = product.get("urls", {}).get(store_key, "").strip()
+            if url and hasattr(module, "scrape_urls"):
+                owners = pending.setdefault(store_key, {}).setdefault(url, [])
+                if owners:
+                    run.flights.saved += 1
+                owners.append((product["id"], product["name"]))
+
+    async def run_chunk(store_key: str, chunk: list[tuple[str, list[tuple[int, str]]]]):
+        batch = [(url, owners[0][1]) for url, owners in chunk]
+        found = await _limited(run.store_sems.get(store_key), STORES[store_key].scrape_urls(batch))
+        return [((pid, store_key), replace(r, product_name=name))
+                for (_, owners), r in zip(chunk, found) for pid, name in owners]
+
+    tasks = []
+    for store_key, by_url in pending.items():
+        size = getattr(STORES[store_key], "BATCH_SIZE", 20)
+        items = list(by_url.items())
+        tasks += [run_chunk(store_key, items[i:i + size]) for i in range(0, len(items), size)]
+
+    prefetched = {}
+    for outcome in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(outcome, Exception):
+            log.warning(f"Lote fallido, se usará scrape_url: {outcome}")
+        else:
+            prefetched.update(outcome)
+    if tasks:
+        log.info(f"{len(prefetched)} precios obtenidos en {len(tasks)} requests por lote")
+    return prefetched
+
+
+def crawl_targets(products: list[dict]) -> list[tuple[str, str]]:
+    """(store_key, búsqueda o "cat:<id>") a recorrer en modo crawl."""
+    stores = [key for key, module in STORES.items() if hasattr(module, "listing")]
+    if CRAWL_TARGETS.strip():
+        targets = []
+        for part in CRAWL_TARGETS.split(","):
+            key, _, query = (s.strip() for s in part.partition("="))
+            if key in stores and query:
+                targets.append((key, query))
+        return targets
+    categories = sorted({p["category"] for p in products if p.get("category")})
+    return [(key, category) for key in stores for category in categories]
+
+
+async def crawl_listing(store_key: str, query: str, run: ScrapeRun, save) -> tuple[int, int]:
+    """Recorre un listado página a página hasta una página incompleta o CRAWL_MAX_PAGES; cada
+    página se entrega a `save(store, items)` apenas llega. Devuelve (requests, productos)."""
+    module = STORES[store_key]
+    size = module.PAGE_SIZE
+    requests = items = 0
+    for page in range(CRAWL_MAX_PAGES):
+        try:
+            found = await _limited(run.store_sems.get(store_key), module.listing(query, page * size, size))
+        except Exception as e:
+            log.warning(f"Listado {store_key} '{query}' cortado en la página {page + 1}: {e}")
+            break
+        requests += 1
+        if found:
+            await save(module.STORE, found)
+            items += len(found)
+        if len(found) < size:
+            break
+    return requests, items
+
+
+def match_listings(products: list[dict], run: ScrapeRun) -> dict[tuple[int, str], ProductPrice]:
+    """Precios de hoy en store_listings para los pares (producto, tienda) del run, buscados por
+    SKU: el de la URL (sku_for del módulo) o, si no, el del último precio guardado."""
+    latest = db.get_latest_prices_bulk([p["id"] for p in products])
+    wanted: dict[str, dict[str, list[dict]]] = {}  # store_key -> sku -> productos
+    for product in products:
+        known = {r["store"]: r["sku"] for r in latest.get(product["id"], []) if r.get("sku")}
+        for store_key in planned_stores(product, run):
+            module = STORES[store_key]
+            if not hasattr(module, "listing"):
+                continue
+            url = product.get("urls", {}).get(store_key, "").strip()
+            sku = (module.sku_for(url) if url else None) or known.get(module.STORE)
+            if sku:
+                wanted.setdefault(store_key, {}).setdefault(sku, []).append(product)
+
+    matched = {}
+    for store_key, by_sku in wanted.items():
+        store = STORES[store_key].STORE
+        for sku, row in db.get_listings(store, list(by_sku)).items():
+            if row["price"] is None:
+                continue  # sin stock en el listado: que lo confirme scrape_url
+            for product in by_sku[sku]:
+                matched[(product["id"], store_key)] = ProductPrice(
+                    store=store, product_name=product["name"],
+                    url=product.get("urls", {}).get(store_key, "").strip() or row["url"],
+                    price=row["price"], original_price=row["original_price"], sku=sku, date=row["date"])
+    return matched
+
+
+async def crawl(products: list[dict], run: ScrapeRun) -> tuple[dict[tuple[int, str], ProductPrice], dict]:
+    """Modo crawl: guarda los listados de crawl_targets() en store_listings y devuelve los precios por SKU
+    de los productos del run junto con un resumen."""
+    targets = crawl_targets(products)
+    loop = asyncio.get_running_loop()
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="crawl-writer")
+
+    async def save(store: str, items: list[ProductPrice]):
+        await loop.run_in_executor(writer, db.save_listings, store, items)
+
+    try:
+        outcomes = await asyncio.gather(*(crawl_listing(key, query, run, save) for key, query in targets))
+    finally:
+        await loop.run_in_executor(writer, db.close)
+        writer.shutdown()
+    matched = match_listings(products, run)
+    summary = {"targets": len(targets), "requests": sum(r for r, _ in outcomes),
+               "items": sum(n for _, n in outcomes), "matched": len(matched)}
+    log.info(f"Crawl: {summary['items']} precios en {summary['requests']} requests de listado, "
+             f"{summary['matched']} tareas resueltas por SKU")
+    return matched, summary
+
+
+def _first(module, found: list[ProductPrice], name: str) -> ProductPrice:
     if found:
-        r = found[0]
-        r.product_name = name
-        return r
+        # copia: el mismo resultado de búsqueda puede servir a varios productos
+        return replace(found[0], product_name=name)
     return ProductPrice(store=module.STORE, product_name=name, url="", price=None, error="Sin resultados")
 
 
-async def run_all() -> dict:
-    db.init()
+def load_products(refresh_resolutions: bool = False) -> list[dict]:
+    """Productos activos, con las URLs resueltas por búsquedas anteriores donde no tienen propia."""
     products = db.get_products()
+    if refresh_resolutions:
+        db.delete_resolutions()
+    resolutions = db.get_resolutions(max_age_days=RESOLVE_TTL_DAYS)
+    return [with_resolutions(p, resolutions) for p in products]
+
+
+async def scrape_to_sink(product: dict, run: ScrapeRun, run_id: int, sink: PriceSink) -> tuple[int, int]:
+    """Scrapea el producto y encola sus precios en el sink. Sus tareas del run quedan ok/error en
+    la misma transacción que los precios (checkpoint). Devuelve (precios, errores)."""
+    log.info(f"Scrapeando: {product['name']}")
+    report = []
+    prices = await scrape_product(product, run, report)
+    await sink.put(product["id"], prices, [(run_id, product["id"], *r) for r in report])
+    ok = sum(1 for p in prices if p.price)
+    err = sum(1 for p in prices if p.error)
+    log.info(f"  {product['name']}: {ok} precios obtenidos, {err} errores")
+    return ok, err
+
+
+def close_stale_tasks(run_id: int, tasks: dict[int, set[str]], products: list[dict], run: ScrapeRun) -> int:
+    """Pasa a error las tareas que ya no se pueden correr (producto desactivado, URL borrada) para
+    que el run pueda terminar. Devuelve cuántas."""
+    by_id = {p["id"]: p for p in products}
+    stale = [(run_id, pid, key, "error", "Producto inactivo o sin URL", 0)
+             for pid, keys in tasks.items()
+             for key in keys - set(planned_stores(by_id[pid], run) if pid in by_id else ())]
+    if stale:
+        db.record_tasks(stale)
+    return len(stale)
+
+
+def open_run(products: list[dict], run: ScrapeRun, resume: bool, only_failed: bool,
+              due: bool = False, budget: int = None) -> tuple[int | None, str, dict | None]:
+    """Abre el run en el ledger (o retoma el último con `resume`; `only_failed` y `due` eligen las tareas).
+    Devuelve (run_id, modo, agenda); run_id None si no hay nada que correr."""
+    if resume:
+        run_id = db.resumable_run()
+        if run_id is None:
+            return None, "resume", None
+        run.tasks = db.get_run_tasks(run_id, "pending")
+        db.reopen_run(run_id)
+        close_stale_tasks(run_id, run.tasks, products, run)
+        return run_id, "resume", None
+    if only_failed:
+        parent = db.last_run()
+        if parent is None:
+            return None, "failed", None
+        run.tasks = db.get_run_tasks(parent, "error")
+        tasks = [(pid, key) for pid, keys in run.tasks.items() for key in keys]
+        if not tasks:
+            return None, "failed", None
+        run_id = db.start_run(tasks, mode="failed", parent_run_id=parent)
+        close_stale_tasks(run_id, run.tasks, products, run)
+        return run_id, "failed", None
+    candidates = [(p, key) for p in products for key in planned_stores(p, run)]
+    if due:
+        run.tasks, agenda = scheduler.due_tasks(candidates, scheduler.BUDGET if budget is None else budget)
+        tasks = [(pid, key) for pid, keys in run.tasks.items() for key in keys]
+        return (db.start_run(tasks, mode="scheduled") if tasks else None), "scheduled", agenda
+    return db.start_run([(p["id"], key) for p, key in candidates]), "full", None
+
+
+async def run_all(refresh_resolutions: bool = False, progress: Callable[[str, dict], None] = None,
+                  resume: bool = False, only_failed: bool = False, due: bool = False,
+                  budget: int = None, crawl_listings: bool = None) -> dict:
+    """Scrapea los productos activos y registra cada (producto, tienda) en el ledger. `progress(event, data)`
+    recibe el avance (ver RunProgress)."""
+    db.init()
+    products = load_products(refresh_resolutions)
     if not products:
         log.warning("No hay productos configurados")
         return {"scraped": 0, "prices": 0, "errors": 0}
 
+    product_sem = asyncio.Semaphore(PRODUCT_CONCURRENCY)
+    run = ScrapeRun(store_sems={key: asyncio.Semaphore(n) for key, n in store_limits().items()})
+    run_id, mode, agenda = open_run(products, run, resume, only_failed, due, budget)
+    if run_id is None:
+        log.info({"resume": "No hay tareas para retomar", "failed": "El último run no tuvo tareas con error",
+                  "scheduled": "Ninguna tarea vence todavía"}[mode])
+        return {"scraped": 0, "prices": 0, "errors": 0, "run_id": None, "mode": mode, "schedule": agenda}
+    if run.tasks is not None:
+        products = [p for p in products if run.tasks.get(p["id"])]
+        log.info(f"Run {run_id} ({mode}): {sum(len(run.tasks[p['id']]) for p in products)} tareas "
+                 f"en {len(products)} productos")
+
     total_prices = 0
     total_errors = 0
+    started = time.monotonic()
 
-    # Scrape todos los productos en paralelo (por producto), secuencial por tienda
-    for product in products:
-        log.info(f"Scrapeando: {product['name']}")
-        try:
-            prices = await scrape_product(product)
-            db.save_prices(product["id"], prices)
-            ok = sum(1 for p in prices if p.price)
-            err = sum(1 for p in prices if p.error)
-            total_prices += ok
-            total_errors += err
-            log.info(f"  {ok} precios obtenidos, {err} errores")
-        except Exception as e:
-            log.error(f"  Error: {e}")
+    tracker = RunProgress(len(products), progress)
+    if progress:
+        progress("start", {**tracker.snapshot(), "run_id": run_id, "mode": mode})
+
+    async def scrape_one(product: dict) -> tuple[int, int]:
+        # Dentro del semáforo: con el buffer del sink lleno no arrancan más productos
+        async with product_sem:
+            return await scrape_to_sink(product, run, run_id, sink)
+
+    # Un pool de conexiones keep-alive por tienda para todo el run; los precios se guardan
+    # en lotes desde el sink, que al cerrarse escribe todo lo pendiente
+    sink = PriceSink(on_write=tracker.product_written)
+    crawled = None
+    async with client.session(warm=[m.BASE_URL for m in STORES.values()]), sink:
+        if CRAWL_ENABLED if crawl_listings is None else crawl_listings:
+            run.prefetched, crawled = await crawl(products, run)
+        if BATCH_ENABLED:
+            run.prefetched.update(await scrape_batches(products, run))
+        # Hasta PRODUCT_CONCURRENCY productos en paralelo, acotados además por tienda
+        outcomes = await asyncio.gather(*(scrape_one(p) for p in products), return_exceptions=True)
+
+    for product, outcome in zip(products, outcomes):
+        if isinstance(outcome, Exception):
+            log.error(f"  Error en {product['name']}: {outcome}")
             total_errors += 1
+        else:
+            total_prices += outcome[0]
+            total_errors += outcome[1]
 
-    return {
+    run_status = db.finish_run(run_id)
+    elapsed = time.monotonic() - started
+    rate = len(products) / elapsed if elapsed > 0 else 0.0
+    log.info(f"{len(products)} productos en {elapsed:.1f}s ({rate:.2f} productos/s), "
+             f"{run.flights.saved} requests ahorrados por deduplicación; run {run_id}: {run_status}")
+
+    summary = {
+        "run_id": run_id,
+        "mode": mode,
+        "run_status": run_status,
         "scraped": len(products),
         "prices": total_prices,
         "errors": total_errors,
         "date": str(date.today()),
+        "elapsed_s": round(elapsed, 2),
+        "products_per_sec": round(rate, 2),
+        "requests_saved": run.flights.saved,
+        "breakers": breaker.snapshot(),
+        "writes": sink.stats(),
+        "stores": db.get_run_stats(run_id),
     }
+    if agenda:
+        summary["schedule"] = agenda
+    if crawled:
+        summary["crawl"] = crawled
+    if PRUNE_AFTER_RUN:
+        try:
+            summary["retention"] = db.prune_history()
+        except Exception as e:
+            log.error(f"Falló la retención del historial: {e}")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Corre el scraping de RetailScope")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--resume", action="store_true", help="Retoma el último run que no terminó")
+    group.add_argument("--failed", action="store_true", help="Reintenta solo las tareas con error del último run")
+    group.add_argument("--due", action="store_true", help="Solo lo que vence según la agenda (scheduler.py)")
+    parser.add_argument("--budget", type=int, help=f"Máximo de tareas con --due (default {scheduler.BUDGET})")
+    parser.add_argument("--crawl", action="store_true", help="Recorre primero los listados (CRAWL_TARGETS)")
+    parser.add_argument("--refresh", action="store_true", help="Vuelve a buscar las URLs resueltas por search_query")
+    args = parser.parse_args()
+    print(asyncio.run(run_all(refresh_resolutions=args.refresh, resume=args.resume, only_failed=args.failed,
+                              due=args.due, budget=args.budget, crawl_listings=args.crawl or None)))
@@ -0,0 +1,73 @@
+import os
+import time
+import logging
+from scrapers import STORES
+import db
+
+log = logging.getLogger(__name__)
+
+# Intervalo entre scrapes de un (producto, tienda): de MAX_INTERVAL (precio estable, sin
+# promo, de la competencia) a MIN_INTERVAL (cambia a diario, en promo o propio), en horas
+MIN_INTERVAL_H = float(os.environ.get("SCHEDULE_MIN_INTERVAL_H", 6))
+MAX_INTERVAL_H = float(os.environ.get("SCHEDULE_MAX_INTERVAL_H", 168))
+# Horas hasta reintentar un par cuyo último scrape falló (si su intervalo es mayor)
+RETRY_H = float(os.environ.get("SCHEDULE_RETRY_H", 2))
+# Tareas (≈ requests) por run programado; lo que vence y no entra queda para el siguiente
+BUDGET = int(os.environ.get("SCHEDULE_BUDGET", 300))
+# Días de price_daily con los que se mide la volatilidad, y mínimo de días para confiar en ella
+WINDOW_DAYS = int(os.environ.get("SCHEDULE_WINDOW_DAYS", 30))
+MIN_DAYS = int(os.environ.get("SCHEDULE_MIN_DAYS", 3))
+# Peso de cada señal en la prioridad (0..1): cambios por día, promoción vigente, producto propio
+W_VOLATILITY = float(os.environ.get("SCHEDULE_W_VOLATILITY", 2.0))
+W_PROMO = float(os.environ.get("SCHEDULE_W_PROMO", 0.5))
+W_OWN = float(os.environ.get("SCHEDULE_W_OWN", 0.5))
+
+
+def priority(signals: dict | None, is_own: bool) -> float:
+    """0 = no se mueve, 1 = lo más urgente. Un par sin historial suficiente cuenta como 1
+    hasta que se sepa cuánto cambia."""
+    if not signals or signals["days"] < MIN_DAYS:
+        return 1.0
+    volatility = signals["changes"] / max(signals["days"] - 1, 1)  # cambios entre días consecutivos
+    score = W_VOLATILITY * volatility + W_PROMO * signals["promo"] + W_OWN * is_own
+    return round(min(1.0, score), 3)
+
+
+def interval(score: float) -> int:
+    """Segundos entre scrapes: interpolación geométrica entre MAX_INTERVAL (0) y MIN_INTERVAL (1)."""
+    return round(MAX_INTERVAL_H * (MIN_INTERVAL_H / MAX_INTERVAL_H) ** score * 3600)
+
+
+def due_tasks(candidates: list[tuple[dict, str]], budget: int = BUDGET,
+              now: float = None) -> tuple[dict[int, set[str]], dict]:
+    """Pares (producto, store_key) vencidos, hasta `budget`, por prioridad más atraso relativo; guarda la
+    prioridad e intervalo de cada candidato. Devuelve ({product_id: {store_key}}, resumen)."""
+    now = now or time.time()
+    signals = db.get_schedule_signals(WINDOW_DAYS)
+    schedule = db.get_schedule()
+    updates, due = [], []
+    for product, store_key in candidates:
+        pid = product["id"]
+        score = priority(signals.get((pid, STORES[store_key].STORE)), bool(product.get("is_own")))
+        every = interval(score)
+        updates.append((pid, store_key, score, every))
+        last = schedule.get((pid, store_key), {})
+        if not last.get("last_scraped"):
+            due.append((score + 1.0, pid, store_key))  # nunca scrapeado: como un intervalo de atraso
+            continue
+        # Al menos 1 s: con SCHEDULE_RETRY_H=0 o un intervalo de 0 el atraso relativo no divide por cero
+        wait = max(every if last["last_status"] == "ok" else min(every, RETRY_H * 3600), 1)
+        late = now - (last["last_scraped"] + wait)
+        if late >= 0:
+            due.append((score + late / wait, pid, store_key))
+    db.update_schedule(updates)
+
+    due.sort(reverse=True)
+    tasks: dict[int, set[str]] = {}
+    for _, pid, store_key in due[:budget]:
+        tasks.setdefault(pid, set()).add(store_key)
+    summary = {"candidates": len(candidates), "due": len(due), "scheduled": min(len(due), budget),
+               "deferred": max(0, len(due) - budget)}
+    log.info(f"Agenda: {summary['due']} de {summary['candidates']} tareas vencidas, "
+             f"{summary['scheduled']} dentro del presupuesto de {budget}")
+    return tasks, summary
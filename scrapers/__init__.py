@@ -1,4 +1,6 @@
+import os
 from . import falabella, ripley, paris, mercadolibre, sodimac, easy
+from . import client, ratelimit, breaker
 from .base import ProductPrice
 
 STORES = {
@@ -27,3 +29,23 @@ STORE_COLORS = {
     "sodimac": "#0070c0",
     "easy": "#ff6600",
 }
+
+
+def store_settings(attr: str, env: str, default=None, cast=float) -> dict:
+    """Valor `attr` de cada módulo de tienda, sobreescribible con env="key=valor,..."."""
+    values = {key: getattr(module, attr, default) for key, module in STORES.items()}
+    for part in os.environ.get(env, "").split(","):
+        if "=" in part:
+            key, val = part.split("=", 1)
+            values[key.strip()] = cast(val)
+    return values
+
+
+for _key, _module in STORES.items():
+    client.register(_key, _module.BASE_URL)
+    breaker.get(_key)
+
+_bursts = store_settings("RATE_BURST", "STORE_RATE_BURST")
+for _key, _rate in store_settings("RATE_LIMIT", "STORE_RATE_LIMIT").items():
+    if _rate:
+        ratelimit.configure(_key, _rate, _bursts.get(_key))
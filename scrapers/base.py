@@ -1,8 +1,13 @@
+import asyncio
 import httpx
 from dataclasses import dataclass, field
 from datetime import date
 from typing import Optional
 
+from . import ratelimit, breaker
+from .breaker import CircuitOpenError
+from .client import client_for, store_for
+
 
 @dataclass
 class ProductPrice:
@@ -17,6 +22,16 @@ class ProductPrice:
     error: Optional[str] = None
 
 
+NOT_FOUND = "Producto no encontrado"
+# Respuestas que dicen que el producto ya no está en la tienda (no una falla pasajera)
+_GONE = ("404 Not Found", "410 Gone", "no encontrado")
+
+
+def is_gone(error: str | None) -> bool:
+    """True si el error es de producto inexistente; timeouts, 5xx o circuito abierto no cuentan."""
+    return bool(error) and any(mark in error for mark in _GONE)
+
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Accept": "application/json, text/plain, */*",
@@ -26,7 +41,49 @@ HEADERS = {
 
 async def fetch(url: str, params: dict = None, headers: dict = None) -> dict | list | None:
     h = {**HEADERS, **(headers or {})}
-    async with httpx.AsyncClient(timeout=15, follow_redirects=True) as client:
-        r = await client.get(url, params=params, headers=h)
-        r.raise_for_status()
-        return r.json()
+    store_key = store_for(url)
+    circuit = breaker.get(store_key)
+    # CircuitOpenError: falla al tiro, sin esperar el timeout. probe: esta llamada es la sonda de half-open
+    probe = circuit.before_call() if circuit else False
+    try:
+        async with client_for(url) as client:
+            r = await _get_with_retries(client, url, params, h, ratelimit.bucket(store_key), circuit)
+    except httpx.TransportError as e:
+        if circuit:
+            circuit.record_failure(timeout=isinstance(e, httpx.TimeoutException), probe=probe)
+        raise
+    except BaseException:
+        if circuit:
+            circuit.release(probe)
+        raise
+    if circuit:
+        if r.status_code in ratelimit.RETRY_STATUSES:
+            circuit.record_failure(probe=probe)
+        else:
+            circuit.record_success(probe)  # un 4xx igual demuestra que la tienda está viva
+    r.raise_for_status()
+    return r.json()
+
+
+async def _get_with_retries(client, url, params, headers, bucket, circuit) -> httpx.Response:
+    for attempt in range(ratelimit.MAX_RETRIES + 1):
+        last = attempt == ratelimit.MAX_RETRIES
+        if attempt and circuit and circuit.state == breaker.OPEN:
+            raise CircuitOpenError(f"Circuito abierto para {circuit.store_key}")
+        if bucket:
+            await bucket.acquire()
+        try:
+            r = await client.get(url, params=params, headers=headers)
+        except httpx.TransportError:
+            if last:
+                raise
+            await asyncio.sleep(ratelimit.backoff(attempt))
+            continue
+        if r.status_code in ratelimit.RETRY_STATUSES and not last:
+            wait = ratelimit.retry_after(r.headers.get("Retry-After"))
+            if wait is not None and bucket:
+                bucket.pause(wait)  # el bucket hace esperar a todos, no solo a este request
+            else:
+                await asyncio.sleep(wait if wait is not None else ratelimit.backoff(attempt))
+            continue
+        return r
@@ -0,0 +1,116 @@
+import os
+import time
+import logging
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+WINDOW = int(os.environ.get("BREAKER_WINDOW", 20))              # últimos N requests evaluados
+MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", 5))
+ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", 0.5))
+MAX_TIMEOUTS = int(os.environ.get("BREAKER_MAX_TIMEOUTS", 3))   # timeouts seguidos que abren el circuito
+COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", 30))        # segundos abierto antes de probar
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """La tienda tiene el circuito abierto: el request se rechaza sin salir a la red."""
+
+
+class CircuitBreaker:
+    def __init__(self, store_key: str, window: int = WINDOW, min_calls: int = MIN_CALLS,
+                 error_rate: float = ERROR_RATE, max_timeouts: int = MAX_TIMEOUTS, cooldown: float = COOLDOWN):
+        self.store_key = store_key
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.max_timeouts = max_timeouts
+        self.cooldown = cooldown
+        self.results: deque[bool] = deque(maxlen=window)
+        self.timeouts = 0
+        self.opened_at: float | None = None
+        self.probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return HALF_OPEN
+        return OPEN
+
+    def before_call(self) -> bool:
+        """Lanza CircuitOpenError si la tienda no acepta requests; en half-open deja pasar una sola
+        sonda. Devuelve True si esta llamada es la sonda."""
+        state = self.state
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        self.rejected += 1
+        raise CircuitOpenError(f"Circuito abierto para {self.store_key}")
+
+    def record_success(self, probe: bool = False):
+        if self.opened_at is not None:
+            log.info(f"Circuito de {self.store_key} cerrado: la tienda respondió")
+            self.opened_at = None
+            self.results.clear()
+            self.probing = False
+        elif probe:
+            self.probing = False
+        self.timeouts = 0
+        self.results.append(True)
+
+    def record_failure(self, timeout: bool = False, probe: bool = False):
+        self.results.append(False)
+        self.timeouts = self.timeouts + 1 if timeout else 0
+        if probe or self._should_trip():
+            self._trip()
+
+    def release(self, probe: bool):
+        """La llamada terminó sin resultado (cancelada o error propio): libera la sonda si era ella."""
+        if probe:
+            self.probing = False
+
+    def _should_trip(self) -> bool:
+        if self.opened_at is not None:
+            return False
+        if self.timeouts >= self.max_timeouts:
+            return True
+        n = len(self.results)
+        return n >= self.min_calls and self.results.count(False) / n >= self.error_rate
+
+    def _trip(self):
+        self.opened_at = time.monotonic()
+        self.probing = False
+        self.trips += 1
+        log.warning(f"Circuito de {self.store_key} abierto por {self.cooldown:.0f}s")
+
+    def snapshot(self) -> dict:
+        n = len(self.results)
+        return {
+            "state": self.state,
+            "error_rate": round(self.results.count(False) / n, 2) if n else 0.0,
+            "recent_calls": n,
+            "consecutive_timeouts": self.timeouts,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get(store_key: str | None) -> CircuitBreaker | None:
+    if not store_key:
+        return None
+    if store_key not in _breakers:
+        _breakers[store_key] = CircuitBreaker(store_key)
+    return _breakers[store_key]
+
+
+def snapshot() -> dict:
+    return {key: b.snapshot() for key, b in _breakers.items()}
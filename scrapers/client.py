@@ -0,0 +1,103 @@
+import os
+import asyncio
+import logging
+import contextvars
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 15))
+MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 20))        # por host
+MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", 10))            # por host
+KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP2 = os.environ.get("HTTP2", "0") == "1"
+
+_pool: contextvars.ContextVar["ClientPool | None"] = contextvars.ContextVar("client_pool", default=None)
+_store_hosts: dict[str, str] = {}
+
+
+def _origin(url: str) -> str:
+    u = urlsplit(url)
+    return f"{u.scheme}://{u.netloc}"
+
+
+def register(store_key: str, base_url: str):
+    _store_hosts[_origin(base_url)] = store_key
+
+
+def store_for(url: str) -> str | None:
+    """Store key (de scrapers.STORES) dueña del host de `url`, si hay una registrada."""
+    return _store_hosts.get(_origin(url))
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ClientPool:
+    """Un AsyncClient con keep-alive por host de tienda, vivo durante todo un run."""
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS, max_keepalive: int = MAX_KEEPALIVE,
+                 keepalive_expiry: float = KEEPALIVE_EXPIRY, http2: bool = HTTP2, timeout: float = TIMEOUT):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = timeout
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            log.warning("HTTP2=1 pero el paquete 'h2' no está instalado; usando HTTP/1.1")
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        origin = _origin(url)
+        client = self._clients.get(origin)
+        if client is None:
+            client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True,
+                                       limits=self.limits, http2=self.http2)
+            self._clients[origin] = client
+        return client
+
+    async def warm(self, base_urls: list[str]):
+        """Resuelve DNS y abre una conexión TLS por host antes de empezar a scrapear."""
+        async def _one(url):
+            try:
+                await self.get(url).head(url, timeout=5)
+            except Exception as e:
+                log.debug(f"Pre-warm falló para {url}: {e}")
+        await asyncio.gather(*(_one(u) for u in base_urls))
+
+    async def aclose(self):
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+
+
+@asynccontextmanager
+async def session(warm: list[str] = None, **kwargs):
+    """Abre el pool compartido para el contexto actual (y las tasks que cree) y lo cierra al salir."""
+    pool = ClientPool(**kwargs)
+    token = _pool.set(pool)
+    try:
+        if warm:
+            await pool.warm(warm)
+        yield pool
+    finally:
+        _pool.reset(token)
+        await pool.aclose()
+
+
+@asynccontextmanager
+async def client_for(url: str):
+    """Cliente del pool activo; fuera de un session() se usa un cliente de un solo uso."""
+    pool = _pool.get()
+    if pool is not None:
+        yield pool.get(url)
+        return
+    async with httpx.AsyncClient(timeout=TIMEOUT, follow_redirects=True) as client:
+        yield client
@@ -3,6 +3,11 @@ import re
 
 
 STORE = "Falabella"
+BASE_URL = "https://www.falabella.com"
+CONCURRENCY = 8  # requests simultáneos máximos a esta tienda
+RATE_LIMIT = 5  # requests/s sostenidos
+RATE_BURST = 10
+PAGE_SIZE = 48  # productos por página del listado (modo crawl)
 
 
 def _parse_price(val) -> float | None:
@@ -11,43 +16,55 @@ def _parse_price(val) -> float | None:
     return float(re.sub(r"[^\d.]", "", str(val))) or None
 
 
+def _listing_item(item: dict, query: str = "") -> ProductPrice:
+    prices = item.get("prices", [])
+    price = None
+    original = None
+    for p in prices:
+        label = p.get("label", "").lower()
+        val = _parse_price(p.get("price"))
+        if "internet" in label or "cmr" in label:
+            price = val
+        elif "normal" in label:
+            original = val
+    if price is None and prices:
+        price = _parse_price(prices[0].get("price"))
+
+    slug = item.get("slug", "")
+    pid = item.get("id", "")
+    url = f"https://www.falabella.com/falabella-cl/product/{pid}/{slug}" if pid else ""
+
+    return ProductPrice(
+        store=STORE,
+        product_name=item.get("displayName", query),
+        url=url,
+        price=price,
+        original_price=original,
+        sku=str(pid),
+    )
+
+
+async def listing(query: str, offset: int = 0, limit: int = PAGE_SIZE) -> list[ProductPrice]:
+    """Una página del listado de una búsqueda o, con "cat:<id>", de una categoría. Lanza si falla."""
+    params = {"page": offset // limit + 1, "limit": limit, "zones": "RM_13_1"}
+    if query.startswith("cat:"):
+        params["categoryId"] = query[4:]
+    else:
+        params["query"] = query
+    data = await fetch("https://www.falabella.com/s/browse/v1/listing/cl", params=params)
+    return [_listing_item(item, query) for item in data.get("data", {}).get("results", [])[:limit]]
+
+
+def sku_for(url: str) -> str | None:
+    match = re.search(r"/product/(\d+)/", url)
+    return match.group(1) if match else None
+
+
 async def search(query: str, limit: int = 5) -> list[ProductPrice]:
-    results = []
     try:
-        data = await fetch(
-            "https://www.falabella.com/s/browse/v1/listing/cl",
-            params={"query": query, "page": 1, "limit": limit, "zones": "RM_13_1"}
-        )
-        items = data.get("data", {}).get("results", [])
-        for item in items[:limit]:
-            prices = item.get("prices", [])
-            price = None
-            original = None
-            for p in prices:
-                label = p.get("label", "").lower()
-                val = _parse_price(p.get("price"))
-                if "internet" in label or "cmr" in label:
-                    price = val
-                elif "normal" in label:
-                    original = val
-            if price is None and prices:
-                price = _parse_price(prices[0].get("price"))
-
-            slug = item.get("slug", "")
-            pid = item.get("id", "")
-            url = f"https://www.falabella.com/falabella-cl/product/{pid}/{slug}" if pid else ""
-
-            results.append(ProductPrice(
-                store=STORE,
-                product_name=item.get("displayName", query),
-                url=url,
-                price=price,
-                original_price=original,
-                sku=str(pid),
-            ))
+        return await listing(query, 0, limit)
     except Exception as e:
-        results.append(ProductPrice(store=STORE, product_name=query, url="", price=None, error=str(e)))
-    return results
+        return [ProductPrice(store=STORE, product_name=query, url="", price=None, error=str(e))]
 
 
 async def scrape_url(url: str, product_name: str = "") -> ProductPrice:
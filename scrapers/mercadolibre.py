@@ -1,40 +1,65 @@
-from .base import fetch, ProductPrice
+from .base import fetch, ProductPrice, NOT_FOUND
+import re
 
 STORE = "MercadoLibre"
+BASE_URL = "https://api.mercadolibre.com"
+CONCURRENCY = 16  # requests simultáneos máximos a esta tienda
+RATE_LIMIT = 10  # requests/s sostenidos
+RATE_BURST = 20
+BATCH_SIZE = 20  # máximo de ids por multi-get /items?ids=
 SITE = "MLC"  # Chile
+PAGE_SIZE = 50  # máximo de resultados por página de /search (modo crawl)
+MAX_OFFSET = 1000  # la búsqueda pública no pasa de offset + limit = 1000
 
 
-async def search(query: str, limit: int = 5) -> list[ProductPrice]:
+def _item_id(url: str) -> str | None:
+    match = re.search(r"MLC-?(\d+)", url)
+    return f"MLC{match.group(1)}" if match else None
+
+
+async def listing(query: str, offset: int = 0, limit: int = PAGE_SIZE) -> list[ProductPrice]:
+    """Una página de /sites/MLC/search para una búsqueda o, con "cat:<id>", una categoría.
+    La API pública no pagina más allá de MAX_OFFSET resultados. Lanza si falla."""
+    if offset >= MAX_OFFSET:
+        return []
+    params = {"offset": offset, "limit": min(limit, MAX_OFFSET - offset)}
+    if query.startswith("cat:"):
+        params["category"] = query[4:]
+    else:
+        params["q"] = query
+    data = await fetch(f"https://api.mercadolibre.com/sites/{SITE}/search", params=params)
     results = []
+    for item in data.get("results", [])[:limit]:
+        price = item.get("price")
+        original = item.get("original_price")
+        results.append(ProductPrice(
+            store=STORE,
+            product_name=item.get("title", query),
+            url=item.get("permalink", ""),
+            price=float(price) if price else None,
+            original_price=float(original) if original else None,
+            sku=item.get("id", ""),
+        ))
+    return results
+
+
+def sku_for(url: str) -> str | None:
+    return _item_id(url)
+
+
+async def search(query: str, limit: int = 5) -> list[ProductPrice]:
     try:
-        data = await fetch(
-            f"https://api.mercadolibre.com/sites/{SITE}/search",
-            params={"q": query, "limit": limit}
-        )
-        for item in data.get("results", [])[:limit]:
-            price = item.get("price")
-            original = item.get("original_price")
-            results.append(ProductPrice(
-                store=STORE,
-                product_name=item.get("title", query),
-                url=item.get("permalink", ""),
-                price=float(price) if price else None,
-                original_price=float(original) if original else None,
-                sku=item.get("id", ""),
-            ))
+        return await listing(query, 0, limit)
     except Exception as e:
-        results.append(ProductPrice(store=STORE, product_name=query, url="", price=None, error=str(e)))
-    return results
+        return [ProductPrice(store=STORE, product_name=query, url="", price=None, error=str(e))]
 
 
 async def scrape_url(url: str, product_name: str = "") -> ProductPrice:
     try:
         # Extraer el ID del item de la URL
-        import re
-        match = re.search(r"MLC-?(\d+)", url)
-        if not match:
+        item_id = _item_id(url)
+        if not item_id:
             raise ValueError("No se encontró ID de MercadoLibre en la URL")
-        item_id = f"MLC{match.group(1)}"
         data = await fetch(f"https://api.mercadolibre.com/items/{item_id}")
         price = data.get("price")
         original = data.get("original_price")
@@ -48,3 +73,38 @@ async def scrape_url(url: str, product_name: str = "") -> ProductPrice:
         )
     except Exception as e:
         return ProductPrice(store=STORE, product_name=product_name or url, url=url, price=None, error=str(e))
+
+
+async def scrape_urls(batch: list[tuple[str, str]]) -> list[ProductPrice]:
+    """Precios de varias URLs (url, product_name) con un solo multi-get, en el mismo orden. Si falla
+    el multi-get lanza, y cada URL se pide por scrape_url."""
+    ids = [_item_id(url) for url, _ in batch]
+    bodies = {}
+    wanted = sorted({i for i in ids if i})
+    if wanted:
+        data = await fetch(f"{BASE_URL}/items",
+                           params={"ids": ",".join(wanted), "attributes": "id,title,price,original_price"})
+        for entry in data or []:
+            body = entry.get("body") or {}
+            if entry.get("code") == 200 and body.get("id"):
+                bodies[body["id"]] = body
+
+    results = []
+    for (url, product_name), item_id in zip(batch, ids):
+        body = bodies.get(item_id)
+        if body is None:
+            msg = "No se encontró ID de MercadoLibre en la URL" if not item_id else NOT_FOUND
+            results.append(ProductPrice(store=STORE, product_name=product_name or url, url=url, price=None,
+                                        sku=item_id, error=msg))
+            continue
+        price = body.get("price")
+        original = body.get("original_price")
+        results.append(ProductPrice(
+            store=STORE,
+            product_name=product_name or body.get("title", url),
+            url=url,
+            price=float(price) if price else None,
+            original_price=float(original) if original else None,
+            sku=item_id,
+        ))
+    return results
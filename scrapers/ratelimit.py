@@ -0,0 +1,78 @@
+import os
+import time
+import random
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 3))
+BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", 0.5))
+BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", 30))
+
+
+class TokenBucket:
+    """Token bucket sin locks: cada acquire reserva un token (el saldo puede quedar
+    negativo) y duerme lo que falte, así que es seguro dentro de un event loop."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """Frena la tienda `seconds` (p. ej. por Retry-After) para todos los que esperan."""
+        self._refill()
+        # el próximo acquire descuenta su token y queda esperando exactamente `seconds`
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+_buckets: dict[str, TokenBucket] = {}
+
+
+def configure(store_key: str, rate: float, burst: float = None):
+    _buckets[store_key] = TokenBucket(rate, burst)
+
+
+def share(parts: int):
+    """Reparte el rate de cada tienda entre `parts` procesos que scrapean a la vez (worker.py)."""
+    for key, b in list(_buckets.items()):
+        configure(key, b.rate / parts, max(1.0, b.burst / parts))
+
+
+def bucket(store_key: str | None) -> TokenBucket | None:
+    return _buckets.get(store_key) if store_key else None
+
+
+def backoff(attempt: int) -> float:
+    """Exponential backoff con full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_after(value: str | None) -> float | None:
+    """Segundos indicados por un header Retry-After (delta o fecha HTTP)."""
+    if not value:
+        return None
+    try:
+        return min(BACKOFF_MAX, max(0.0, float(value)))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return min(BACKOFF_MAX, max(0.0, (when - datetime.now(timezone.utc)).total_seconds()))
@@ -2,6 +2,10 @@ from .base import fetch, ProductPrice
 import re
 
 STORE = "Ripley"
+BASE_URL = "https://simple.ripley.cl"
+CONCURRENCY = 6  # requests simultáneos máximos a esta tienda
+RATE_LIMIT = 4  # requests/s sostenidos
+RATE_BURST = 8
 
 
 async def search(query: str, limit: int = 5) -> list[ProductPrice]:
@@ -0,0 +1,20 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Comparte el resultado de llamadas idénticas durante un run: la primera con una key sale
+    a la red y las siguientes (en vuelo o ya terminadas) esperan ese mismo resultado."""
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.saved = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        fut = self._calls.get(key)
+        if fut is None:
+            fut = self._calls[key] = asyncio.ensure_future(fn())
+        else:
+            self.saved += 1
+        # shield: si se cancela quien espera, no se cancela la llamada compartida
+        return await asyncio.shield(fut)
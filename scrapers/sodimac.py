@@ -2,33 +2,50 @@ from .base import fetch, ProductPrice
 import re
 
 STORE = "Sodimac"
+BASE_URL = "https://www.sodimac.cl"
+CONCURRENCY = 2  # requests simultáneos máximos a esta tienda
+RATE_LIMIT = 1  # requests/s sostenidos
+RATE_BURST = 2
+PAGE_SIZE = 48  # Nrpp por página del listado (modo crawl)
 
 
-async def search(query: str, limit: int = 5) -> list[ProductPrice]:
+async def listing(query: str, offset: int = 0, limit: int = PAGE_SIZE) -> list[ProductPrice]:
+    """Una página de resultados de búsqueda (Nrpp por página desde No). Lanza si falla."""
+    if query.startswith("cat:"):
+        raise ValueError("Sodimac solo lista por búsqueda")
+    data = await fetch(
+        "https://www.sodimac.cl/sodimac-cl/search/results",
+        params={"Ntt": query, "No": offset, "Nrpp": limit, "sortBy": "Default", "v": "json"}
+    )
+    items = data.get("data", {}).get("searchResults", {}).get("resultsets", [{}])[0].get("results", [])
     results = []
+    for item in items[:limit]:
+        prices = item.get("prices", {})
+        price = prices.get("internetPrice") or prices.get("normalPrice")
+        original = prices.get("normalPrice") if prices.get("internetPrice") else None
+        pid = item.get("id", "")
+        url = f"https://www.sodimac.cl/sodimac-cl/product/{pid}" if pid else ""
+        results.append(ProductPrice(
+            store=STORE,
+            product_name=item.get("name", query),
+            url=url,
+            price=float(price) if price else None,
+            original_price=float(original) if original else None,
+            sku=str(pid),
+        ))
+    return results
+
+
+def sku_for(url: str) -> str | None:
+    match = re.search(r"/product/([^/]+)", url)
+    return match.group(1) if match else None
+
+
+async def search(query: str, limit: int = 5) -> list[ProductPrice]:
     try:
-        data = await fetch(
-            "https://www.sodimac.cl/sodimac-cl/search/results",
-            params={"Ntt": query, "No": 0, "Nrpp": limit, "sortBy": "Default", "v": "json"}
-        )
-        items = data.get("data", {}).get("searchResults", {}).get("resultsets", [{}])[0].get("results", [])
-        for item in items[:limit]:
-            prices = item.get("prices", {})
-            price = prices.get("internetPrice") or prices.get("normalPrice")
-            original = prices.get("normalPrice") if prices.get("internetPrice") else None
-            pid = item.get("id", "")
-            url = f"https://www.sodimac.cl/sodimac-cl/product/{pid}" if pid else ""
-            results.append(ProductPrice(
-                store=STORE,
-                product_name=item.get("name", query),
-                url=url,
-                price=float(price) if price else None,
-                original_price=float(original) if original else None,
-                sku=str(pid),
-            ))
+        return await listing(query, 0, limit)
     except Exception as e:
-        results.append(ProductPrice(store=STORE, product_name=query, url="", price=None, error=str(e)))
-    return results
+        return [ProductPrice(store=STORE, product_name=query, url="", price=None, error=str(e))]
 
 
 async def scrape_url(url: str, product_name: str = "") -> ProductPrice:
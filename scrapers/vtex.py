@@ -0,0 +1,124 @@
+from .base import fetch, ProductPrice, NOT_FOUND
+import asyncio
+from typing import Callable
+
+BATCH_SIZE = 50  # VTEX devuelve hasta 50 productos por búsqueda
+
+
+def _offer(item: dict) -> tuple[float | None, float | None]:
+    items_data = item.get("items", [{}])
+    sellers = items_data[0].get("sellers", [{}]) if items_data else [{}]
+    offer = sellers[0].get("commertialOffer", {}) if sellers else {}
+    price = offer.get("Price")
+    original = offer.get("ListPrice")
+    return (float(price) if price else None,
+            float(original) if original and original != price else None)
+
+
+class Catalog:
+    """API de catálogo de una tienda VTEX (Paris, Easy): búsqueda, listados y precios por URL o
+    en lote por productId. `slug` saca de la URL de producto el linkText que usa VTEX."""
+
+    def __init__(self, store: str, base_url: str, slug: Callable[[str], str], page_size: int = BATCH_SIZE):
+        self.store = store
+        self.search_url = f"{base_url}/api/catalog_system/pub/products/search/"
+        self.slug = slug
+        self.page_size = page_size
+        self.product_ids: dict[str, str] = {}  # slug -> productId visto en respuestas o guardado
+
+    def remember(self, url: str, product_id: str):
+        """Aprende el productId de una URL (p. ej. el SKU del último precio guardado)."""
+        if url and product_id:
+            self.product_ids[self.slug(url)] = product_id
+
+    def sku_for(self, url: str) -> str | None:
+        """productId de la URL, si ya apareció en un listado, búsqueda o scrape_url."""
+        return self.product_ids.get(self.slug(url))
+
+    async def listing(self, query: str, offset: int = 0, limit: int = None) -> list[ProductPrice]:
+        """Una página (_from/_to) de una búsqueda o, con "cat:<id>", de una categoría. Lanza si falla."""
+        limit = limit or self.page_size
+        params = {"_from": offset, "_to": offset + limit - 1}
+        if query.startswith("cat:"):
+            params["fq"] = f"C:/{query[4:].strip('/')}/"
+        else:
+            params["ft"] = query
+        data = await fetch(self.search_url, params=params)
+        results = []
+        for item in (data or [])[:limit]:
+            price, original = _offer(item)
+            if item.get("linkText") and item.get("productId"):
+                self.product_ids[item["linkText"]] = item["productId"]
+            results.append(ProductPrice(
+                store=self.store,
+                product_name=item.get("productName", query),
+                url=item.get("link", ""),
+                price=price,
+                original_price=original,
+                sku=item.get("productId", ""),
+            ))
+        return results
+
+    async def search(self, query: str, limit: int = 5) -> list[ProductPrice]:
+        try:
+            return await self.listing(query, 0, limit)
+        except Exception as e:
+            return [ProductPrice(store=self.store, product_name=query, url="", price=None, error=str(e))]
+
+    async def scrape_url(self, url: str, product_name: str = "") -> ProductPrice:
+        try:
+            slug = self.slug(url)
+            data = await fetch(f"{self.search_url}{slug}/p")
+            if not data:
+                raise LookupError(NOT_FOUND)
+            item = data[0]
+            if item.get("productId"):
+                self.product_ids[slug] = item["productId"]
+            price, original = _offer(item)
+            return ProductPrice(
+                store=self.store,
+                product_name=product_name or item.get("productName", url),
+                url=url,
+                price=price,
+                original_price=original,
+                sku=item.get("productId", ""),
+            )
+        except Exception as e:
+            return ProductPrice(store=self.store, product_name=product_name or url, url=url, price=None, error=str(e))
+
+    async def scrape_urls(self, batch: list[tuple[str, str]]) -> list[ProductPrice]:
+        """Precios de varias URLs (url, product_name) en una búsqueda fq=productId:, en el mismo orden.
+        Las URLs cuyo productId no conocemos o no aparece van por scrape_url (y quedan aprendidas).
+        Si falla la búsqueda lanza, y cada URL se pide por scrape_url."""
+        slugs = [self.slug(url) for url, _ in batch]
+        ids = sorted({self.product_ids[s] for s in slugs if s in self.product_ids})
+        by_id = {}
+        if ids:
+            data = await fetch(
+                self.search_url,
+                params=[("fq", f"productId:{i}") for i in ids] + [("_from", 0), ("_to", len(ids) - 1)]
+            )
+            by_id = {item.get("productId"): item for item in data or []}
+
+        # Sin productId conocido, o con uno (p. ej. guardado) que la búsqueda ya no devuelve
+        known = [self.product_ids.get(slug) for slug in slugs]
+        unknown = [(i, url, name) for i, ((url, name), pid) in enumerate(zip(batch, known)) if pid not in by_id]
+        fallback = await asyncio.gather(*(self.scrape_url(url, name) for _, url, name in unknown))
+
+        results: list[ProductPrice | None] = [None] * len(batch)
+        for (i, _, _), r in zip(unknown, fallback):
+            results[i] = r
+        for i, ((url, product_name), pid) in enumerate(zip(batch, known)):
+            if results[i] is not None:
+                continue
+            item = by_id[pid]
+            price, original = _offer(item)
+            results[i] = ProductPrice(
+                store=self.store,
+                product_name=product_name or item.get("productName", url),
+                url=url,
+                price=price,
+                original_price=original,
+                sku=pid,
+            )
+        return results
@@ -1,15 +1,45 @@
-import os, json, asyncio, logging, threading
+import os, io, gzip, json, time, queue, base64, signal, socket, asyncio, hashlib, logging, functools, selectors, threading
+from datetime import date
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import db
 from main import run_all
-from scrapers import STORE_LABELS, STORE_COLORS
+from scrapers import STORES, STORE_LABELS, STORE_COLORS, breaker
+
+try:
+    import brotli
+except ImportError:  # opcional: sin el paquete se sirve solo gzip
+    brotli = None
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger(__name__)
 
 CRON_SECRET = os.environ.get("CRON_SECRET", "changeme")
-scrape_status = {"running": False, "last": None}
+# /api/run sin ?due= corre solo lo que vence según la agenda (scheduler.py) en vez de todo
+SCHEDULED_RUNS = os.environ.get("SCHEDULED_RUNS", "0") == "1"
+# "threads" (pool acotado), "asyncio" (conexiones en el event loop, handlers en el pool) o
+# "single" (HTTPServer original, un request a la vez)
+SERVER_MODE = os.environ.get("SERVER_MODE", "threads")
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", 16))
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", 30))      # seg. para leer y atender un request
+KEEPALIVE_TIMEOUT = float(os.environ.get("KEEPALIVE_TIMEOUT", 15))  # seg. de una conexión ociosa
+SHUTDOWN_TIMEOUT = float(os.environ.get("SHUTDOWN_TIMEOUT", 10))    # seg. de gracia al apagar
+# Servir CSS y JS como /static/app.<hash>.css|js cacheables en vez de inline en el HTML
+STATIC_ASSETS = os.environ.get("STATIC_ASSETS", "0") == "1"
+GZIP_MIN_BYTES = 1024
+MAX_PAGE_SIZE = 500
+MAX_HISTORY_DAYS = 3650
+PRODUCT_FIELDS = ("latest_prices", "price_history")
+scrape_status = {"running": False, "last": None, "progress": None}
+SSE_PING = 15  # seg. entre comentarios keep-alive de /api/run/events
+SSE_MAX_STREAMS = 64  # streams simultáneos en modo threads; más allá, 503 y el dashboard consulta /api/status
+# Respuestas JSON por URL mientras no cambie db.data_version(): path -> (etag, body, gzip)
+_json_cache: dict[str, tuple[str, bytes, bytes | None]] = {}
+_JSON_CACHE_MAX = 256
+_run_lock = threading.Lock()
+_scrape_thread: threading.Thread | None = None
 
 # ── HTML Templates ─────────────────────────────────────────────────────────────
 
@@ -148,6 +178,16 @@ input:focus,select:focus,textarea:focus{border-color:var(--accent);background:#f
 SCRIPT = """
 const STORE_COLORS = """ + json.dumps(STORE_COLORS) + """;
 let currentView = 'dashboard';
+// Dashboard paginado: la primera página llega rápido y el resto se pide al hacer scroll
+const PAGE_SIZE = 24;
+let dashQuery = {};
+let nextCursor = null;
+let loadingPage = false;
+let pageObserver = null;
+
+function productsUrl(params) {
+  return '/api/products?' + new URLSearchParams({history: 'columnar', ...params});
+}
 
 function nav(view) {
   currentView = view;
@@ -163,11 +203,12 @@ async function loadView(view) {
     title.textContent = 'Dashboard';
     subtitle.textContent = 'Precios actuales y comparación por tienda';
     content.innerHTML = '<div class="loading" style="text-align:center;padding:60px;color:var(--muted)">Cargando...</div>';
-    const [products, stats] = await Promise.all([
-      fetch('/api/products').then(r=>r.json()),
+    dashQuery = {};
+    const [page, stats] = await Promise.all([
+      fetch(productsUrl({limit: PAGE_SIZE})).then(r=>r.json()),
       fetch('/api/stats').then(r=>r.json())
     ]);
-    renderDashboard(products, stats, content);
+    renderDashboard(page, stats, content);
   } else if (view === 'admin') {
     title.textContent = 'Administración';
     subtitle.textContent = 'Gestiona productos propios y competencia';
@@ -177,7 +218,8 @@ async function loadView(view) {
   }
 }
 
-function renderDashboard(products, stats, container) {
+function renderDashboard(page, stats, container) {
+  const products = page.items;
   const alerts = products.flatMap(p =>
     (p.latest_prices || []).filter(pr => pr.drop_pct > 5).map(pr => ({...pr, product: p.name}))
   );
@@ -207,7 +249,7 @@ function renderDashboard(products, stats, container) {
   </div>`;
 
   // Filter bar
-  const categories = [...new Set(products.map(p => p.category).filter(Boolean))];
+  const categories = stats.categories || [];
   html += `
   <div class="section-header">
     <div class="section-title">Comparación de precios</div>
@@ -218,30 +260,53 @@ function renderDashboard(products, stats, container) {
       ${categories.map(c => `<button class="filter-btn" onclick="filterProducts('${c}', this)">${c}</button>`).join('')}
     </div>
   </div>
-  <div class="products-grid" id="products-grid">`;
+  <div class="products-grid" id="products-grid"></div>
+  <div id="products-more" style="height:1px"></div>`;
+  container.innerHTML = html;
+  showPage(page, true);
+
+  if (pageObserver) pageObserver.disconnect();
+  pageObserver = new IntersectionObserver(entries => {
+    if (entries.some(e => e.isIntersecting)) loadMoreProducts();
+  }, {rootMargin: '800px'});
+  pageObserver.observe(document.getElementById('products-more'));
+}
 
-  if (!products.length) {
-    html += `<div class="empty-state" style="grid-column:1/-1">
+function showPage(page, first) {
+  const grid = document.getElementById('products-grid');
+  if (!grid) return;
+  const products = page.items;
+  nextCursor = page.next_cursor;
+  if (first && !products.length) {
+    grid.innerHTML = `<div class="empty-state" style="grid-column:1/-1">
       <div class="empty-icon">📦</div>
       <div class="empty-title">Sin productos</div>
       <div class="empty-sub">Ve a Administración para agregar tus productos y los de la competencia</div>
     </div>`;
+    return;
   }
-
-  for (const p of products) {
-    html += renderProductCard(p);
-  }
-  html += '</div>';
-  container.innerHTML = html;
+  grid.insertAdjacentHTML('beforeend', products.map(renderProductCard).join(''));
 
   // Draw mini charts
   for (const p of products) {
-    if (p.price_history && p.price_history.length > 1) {
+    if (p.price_history && p.price_history.dates.length > 1) {
       drawMiniChart(p.id, p.price_history);
     }
   }
 }
 
+async function loadMoreProducts() {
+  if (!nextCursor || loadingPage) return;
+  loadingPage = true;
+  try {
+    const query = dashQuery;
+    const page = await fetch(productsUrl({...query, limit: PAGE_SIZE, cursor: nextCursor})).then(r=>r.json());
+    if (query === dashQuery) showPage(page, false);
+  } finally {
+    loadingPage = false;
+  }
+}
+
 function renderProductCard(p) {
   const prices = p.latest_prices || [];
   const minPrice = prices.length ? Math.min(...prices.map(x => x.price)) : 0;
@@ -275,10 +340,10 @@ function renderProductCard(p) {
     }
   }
 
-  const hasHistory = (p.price_history || []).length > 1;
+  const hasHistory = p.price_history && p.price_history.dates.length > 1;
 
   return `
-  <div class="product-card" data-own="${p.is_own}" data-cat="${p.category || ''}">
+  <div class="product-card" id="card-${p.id}" data-own="${p.is_own}" data-cat="${p.category || ''}">
     <div class="pc-header">
       <div>
         <div class="pc-name">${p.name}</div>
@@ -296,25 +361,27 @@ function renderProductCard(p) {
   </div>`;
 }
 
+// history: {dates: [...], series: {tienda: [precio o null por fecha]}} (history=columnar)
 function drawMiniChart(productId, history) {
   const canvas = document.getElementById(`chart-${productId}`);
   if (!canvas) return;
   canvas.width = canvas.offsetWidth || 300;
 
   const ctx = canvas.getContext('2d');
-  const stores = [...new Set(history.map(h => h.store))];
-  const dates = [...new Set(history.map(h => h.date))].sort();
+  const n = history.dates.length;
 
   const W = canvas.width, H = 60;
-  const allPrices = history.map(h => h.price).filter(Boolean);
-  const minP = Math.min(...allPrices) * 0.95;
-  const maxP = Math.max(...allPrices) * 1.05;
+  let minP = Infinity, maxP = -Infinity;
+  for (const prices of Object.values(history.series)) {
+    for (const v of prices) if (v) { if (v < minP) minP = v; if (v > maxP) maxP = v; }
+  }
+  minP *= 0.95;
+  maxP *= 1.05;
 
   ctx.clearRect(0, 0, W, H);
 
-  for (const store of stores) {
-    const storeData = history.filter(h => h.store === store && h.price);
-    if (storeData.length < 2) continue;
+  for (const [store, prices] of Object.entries(history.series)) {
+    if (prices.filter(Boolean).length < 2) continue;
     const color = STORE_COLORS[store.toLowerCase()] || '#6b7280';
 
     ctx.beginPath();
@@ -322,25 +389,30 @@ function drawMiniChart(productId, history) {
     ctx.lineWidth = 2;
     ctx.lineJoin = 'round';
 
-    storeData.forEach((point, i) => {
-      const x = ((dates.indexOf(point.date)) / (dates.length - 1)) * (W - 4) + 2;
-      const y = H - ((point.price - minP) / (maxP - minP)) * (H - 8) - 4;
-      i === 0 ? ctx.moveTo(x, y) : ctx.lineTo(x, y);
+    let started = false;
+    prices.forEach((price, i) => {
+      if (!price) return;
+      const x = (i / (n - 1)) * (W - 4) + 2;
+      const y = H - ((price - minP) / (maxP - minP)) * (H - 8) - 4;
+      started ? ctx.lineTo(x, y) : ctx.moveTo(x, y);
+      started = true;
     });
     ctx.stroke();
   }
 }
 
-function filterProducts(filter, btn) {
+async function filterProducts(filter, btn) {
   document.querySelectorAll('.filter-btn').forEach(b => b.classList.remove('active'));
   btn.classList.add('active');
-  document.querySelectorAll('.product-card').forEach(card => {
-    let show = true;
-    if (filter === 'own') show = card.dataset.own === '1';
-    else if (filter === 'comp') show = card.dataset.own === '0';
-    else if (filter !== 'all') show = card.dataset.cat === filter;
-    card.style.display = show ? '' : 'none';
-  });
+  if (filter === 'own') dashQuery = {is_own: 1};
+  else if (filter === 'comp') dashQuery = {is_own: 0};
+  else if (filter !== 'all') dashQuery = {category: filter};
+  else dashQuery = {};
+  const query = dashQuery;
+  const page = await fetch(productsUrl({...query, limit: PAGE_SIZE})).then(r=>r.json());
+  if (query !== dashQuery) return;  // otro filtro se eligió mientras cargaba
+  document.getElementById('products-grid').innerHTML = '';
+  showPage(page, true);
 }
 
 function renderAdmin(products, container) {
@@ -442,19 +514,73 @@ async function toggleActive(id, current) {
 }
 
 async function runScraper() {
+  const r = await fetch('/api/run', {method: 'POST'});
+  const data = await r.json();
+  toast(data.status === 'already_running' ? 'Ya hay un scraping en curso' : 'Scraping iniciado');
+  watchRun();
+}
+
+// Progreso en vivo del run vía /api/run/events: cada producto guardado actualiza su tarjeta
+let runEvents = null;
+
+function watchRun() {
+  if (runEvents) return;
   const btn = document.getElementById('run-btn');
+  const badge = document.getElementById('badge-running');
   btn.disabled = true;
   btn.innerHTML = '<div class="run-pulse"></div> Corriendo...';
-  document.getElementById('badge-running').classList.add('show');
-  const r = await fetch('/api/run', {method: 'POST'});
-  const data = await r.json();
-  toast('Scraping iniciado — esto tarda ~1 minuto');
-  setTimeout(() => {
+  badge.classList.add('show');
+
+  const showProgress = d => {
+    if (!d || !d.total) return;
+    const eta = d.eta_s != null ? ` · ETA ${Math.ceil(d.eta_s)}s` : '';
+    badge.textContent = `⏳ ${d.done}/${d.total} productos · ${d.products_per_sec}/s${eta}`;
+  };
+
+  const finish = d => {
+    runEvents = null;
     btn.disabled = false;
     btn.innerHTML = '▶ Ejecutar ahora';
-    document.getElementById('badge-running').classList.remove('show');
-    if (currentView === 'dashboard') loadView('dashboard');
-  }, 65000);
+    badge.classList.remove('show');
+    badge.textContent = '⏳ Scraping en progreso';
+    if (d.error) toast('El scraping falló: ' + d.error, 'error');
+    else if (d.scraped != null) toast(`Scraping listo: ${d.prices} precios, ${d.errors} errores`);
+  };
+
+  // Sin stream (503 en modo single o con demasiados clientes): polling de /api/status
+  const poll = async () => {
+    const s = await fetch('/api/status').then(r => r.json()).catch(() => ({running: true}));
+    if (s.running) { showProgress(s.progress); setTimeout(poll, 3000); }
+    else finish(s.last || {});
+  };
+
+  runEvents = new EventSource('/api/run/events');
+  runEvents.onerror = () => {
+    if (runEvents.readyState !== EventSource.CLOSED) return;  // EventSource reconecta solo
+    runEvents = {close() {}};
+    poll();
+  };
+  runEvents.addEventListener('status', e => showProgress(JSON.parse(e.data)));
+  runEvents.addEventListener('start', e => showProgress(JSON.parse(e.data)));
+  runEvents.addEventListener('product', e => {
+    const d = JSON.parse(e.data);
+    showProgress(d);
+    if (d.saved && currentView === 'dashboard') refreshCard(d.product_id);
+  });
+  runEvents.addEventListener('done', e => {
+    runEvents.close();
+    finish(JSON.parse(e.data));
+  });
+}
+
+async function refreshCard(productId) {
+  const card = document.getElementById(`card-${productId}`);
+  if (!card) return;  // solo las tarjetas ya cargadas en el dashboard
+  const p = await fetch(`/api/products/${productId}?history=columnar`).then(r => r.ok ? r.json() : null);
+  const current = document.getElementById(`card-${productId}`);
+  if (!p || !current) return;
+  current.outerHTML = renderProductCard(p);
+  if (p.price_history && p.price_history.dates.length > 1) drawMiniChart(p.id, p.price_history);
 }
 
 function toast(msg, type='ok') {
@@ -467,17 +593,20 @@ function toast(msg, type='ok') {
 
 // Init
 nav('dashboard');
+fetch('/api/status').then(r => r.json()).then(s => { if (s.running) watchRun(); });
 """
 
 
-def full_html(body_content: str, active_view: str = "dashboard") -> str:
+def full_html(body_content: str, active_view: str = "dashboard", css_href: str = None, js_src: str = None) -> str:
+    style = f'<link rel="stylesheet" href="{css_href}">' if css_href else f"<style>{CSS}</style>"
+    script = f'<script src="{js_src}"></script>' if js_src else f"<script>{SCRIPT}</script>"
     return f"""<!DOCTYPE html>
 <html lang="es">
 <head>
 <meta charset="UTF-8">
 <meta name="viewport" content="width=device-width,initial-scale=1">
 <title>RetailScope</title>
-<style>{CSS}</style>
+{style}
 </head>
 <body>
 <div class="shell">
@@ -516,32 +645,339 @@ def full_html(body_content: str, active_view: str = "dashboard") -> str:
   </div>
 </div>
 <div class="toast" id="toast"></div>
-<script>{SCRIPT}</script>
+{script}
 </body>
 </html>"""
 
 
+# ── Static shell ───────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class Asset:
+    """Respuesta estática renderizada una vez, con sus variantes comprimidas."""
+    content_type: str
+    body: bytes
+    gzip: bytes
+    br: bytes | None
+    etag: str
+    cache_control: str
+
+
+def _asset(text: str, content_type: str, cache_control: str) -> Asset:
+    body = text.encode()
+    return Asset(content_type=content_type, body=body,
+                 gzip=gzip.compress(body, 9, mtime=0),
+                 br=brotli.compress(body) if brotli else None,
+                 etag=f'W/"{hashlib.sha256(body).hexdigest()[:16]}"',
+                 cache_control=cache_control)
+
+
+@functools.lru_cache(maxsize=1)
+def shell_assets() -> dict[str, Asset]:
+    """Rutas estáticas: "/" y, con STATIC_ASSETS, el CSS y JS con el hash del contenido en el
+    nombre (cacheables para siempre: si cambian, cambia la URL). El HTML se revalida con ETag."""
+    assets, css_href, js_src = {}, None, None
+    if STATIC_ASSETS:
+        css = _asset(CSS, "text/css; charset=utf-8", "public, max-age=31536000, immutable")
+        js = _asset(SCRIPT, "application/javascript; charset=utf-8", "public, max-age=31536000, immutable")
+        css_href = f"/static/app.{css.etag[3:11]}.css"
+        js_src = f"/static/app.{js.etag[3:11]}.js"
+        assets[css_href], assets[js_src] = css, js
+    assets["/"] = _asset(full_html("", css_href=css_href, js_src=js_src), "text/html; charset=utf-8", "no-cache")
+    return assets
+
+
+def _qvalue(params: str) -> float:
+    """q de un elemento de Accept-Encoding; sin q, o con uno ilegible, vale 1."""
+    q = params.strip()
+    if not q.startswith("q="):
+        return 1.0
+    try:
+        return float(q[2:])
+    except ValueError:
+        return 1.0
+
+
+def _accepts(header: str, coding: str) -> bool:
+    """True si Accept-Encoding acepta `coding` (presente, o vía *, y sin q=0)."""
+    found = None
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if name in (coding, "*"):
+            ok = _qvalue(params) > 0
+            if name == coding:
+                return ok
+            found = ok
+    return bool(found)
+
+
+# ── API payloads ───────────────────────────────────────────────────────────────
+
+def _encode_cursor(product: dict) -> str:
+    key = json.dumps([product["is_own"], product["name"], product["id"]], ensure_ascii=False)
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    own, name, pid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    return int(own), str(name), int(pid)
+
+
+def _int_param(params: dict, key: str, default: int, lo: int, hi: int) -> int:
+    return max(lo, min(hi, int(params.get(key, [default])[0])))
+
+
+def products_payload(params: dict) -> tuple[int, list | dict]:
+    """GET /api/products: filtros active, is_own, category y store; fields, days e history=columnar.
+    Con limit devuelve {"items", "next_cursor"}; sin limit, la lista completa."""
+    one = lambda key: params.get(key, [""])[0].strip()
+    try:
+        limit = _int_param(params, "limit", 0, 0, MAX_PAGE_SIZE)
+        days = _int_param(params, "days", 90, 1, MAX_HISTORY_DAYS)
+        after = _decode_cursor(one("cursor")) if one("cursor") else None
+    except (ValueError, TypeError):
+        return 400, {"error": "limit, days o cursor inválido"}
+    is_own = {"1": True, "0": False}.get(one("is_own"))
+    store = one("store")
+    if store in STORES:
+        store = STORES[store].STORE
+    fields = [f for f in one("fields").split(",") if f] or None
+
+    products = db.get_products(active_only=one("active") != "all", is_own=is_own,
+                               category=one("category") or None, store=store or None,
+                               after=after, limit=limit or None)
+    # Enrich with prices (2 queries en total, no 2 por producto)
+    ids = [prod["id"] for prod in products]
+    wanted = [f for f in PRODUCT_FIELDS if fields is None or f in fields]
+    latest = db.get_latest_prices_bulk(ids) if "latest_prices" in wanted else {}
+    columnar = one("history") == "columnar"
+    history = db.get_price_history_bulk(ids, days=days, columnar=columnar) if "price_history" in wanted else {}
+    empty_history = {"dates": [], "series": {}} if columnar else []
+    next_cursor = _encode_cursor(products[-1]) if limit and len(products) == limit else None
+    for i, prod in enumerate(products):
+        if "latest_prices" in wanted:
+            prod["latest_prices"] = latest.get(prod["id"], [])
+        if "price_history" in wanted:
+            prod["price_history"] = history.get(prod["id"], empty_history)
+        if fields is not None:
+            products[i] = {k: v for k, v in prod.items() if k == "id" or k in fields}
+    if limit:
+        return 200, {"items": products, "next_cursor": next_cursor}
+    return 200, products
+
+
+def product_payload(pid: int, params: dict) -> tuple[int, dict]:
+    prod = db.get_product(pid)
+    if not prod:
+        return 404, {"error": "not found"}
+    try:
+        days = _int_param(params, "days", 90, 1, MAX_HISTORY_DAYS)
+    except ValueError:
+        return 400, {"error": "days inválido"}
+    prod["latest_prices"] = db.get_latest_prices(pid)
+    columnar = params.get("history", [""])[0] == "columnar"
+    prod["price_history"] = db.get_price_history(pid, days=days, columnar=columnar)
+    return 200, prod
+
+
+# ── Run progress (SSE) ─────────────────────────────────────────────────────────
+
+class ProgressBroker:
+    """Reparte los eventos de progreso de run_all a los clientes de /api/run/events; cada suscriptor recibe (event, data) sin bloquear."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: set = set()
+
+    def subscribe(self, fn):
+        with self._lock:
+            self._subs.add(fn)
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            self._subs.discard(fn)
+
+    def publish(self, event: str, data: dict):
+        if event in ("start", "product"):
+            scrape_status["progress"] = {k: v for k, v in data.items() if k not in ("product_id", "saved", "prices")}
+        with self._lock:
+            subs = list(self._subs)
+        for fn in subs:
+            try:
+                fn((event, data))
+            except Exception as e:
+                log.debug(f"Suscriptor de progreso descartado: {e}")
+                self.unsubscribe(fn)
+
+
+progress_broker = ProgressBroker()
+
+
+def _sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n".encode()
+
+
+_SSE_HEAD = ("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+             "X-Accel-Buffering: no\r\nConnection: close\r\n\r\n").encode()
+
+
+def _sse_intro() -> tuple[bytes, bool]:
+    """Primer evento del stream (estado actual) y si seguir escuchando; se llama ya suscrito para no perder el "done"."""
+    if scrape_status["running"]:
+        return _sse("status", scrape_status["progress"] or {}), True
+    return _sse("done", scrape_status["last"] or {}), False
+
+
+def _pump_run_events(server: "PooledHTTPServer", request: socket.socket):
+    """Escribe el stream SSE en un socket ya separado del pool; se cierra con "done"."""
+    events: queue.Queue = queue.Queue()
+    progress_broker.subscribe(events.put)
+    try:
+        intro, keep = _sse_intro()
+        request.sendall(_SSE_HEAD + intro)
+        while keep and not server.stopping:
+            try:
+                event, data = events.get(timeout=SSE_PING)
+            except queue.Empty:
+                request.sendall(b": ping\n\n")
+            else:
+                request.sendall(_sse(event, data))
+                keep = event != "done"
+    except OSError:
+        pass
+    finally:
+        progress_broker.unsubscribe(events.put)
+        server.release(request)
+
+
+async def stream_run_events(writer: asyncio.StreamWriter):
+    """/api/run/events en modo asyncio: el stream vive en el event loop, sin ocupar un worker."""
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def push(item):
+        loop.call_soon_threadsafe(events.put_nowait, item)
+
+    progress_broker.subscribe(push)
+    try:
+        intro, keep = _sse_intro()
+        writer.write(_SSE_HEAD + intro)
+        await writer.drain()
+        while keep:
+            try:
+                event, data = await asyncio.wait_for(events.get(), SSE_PING)
+            except asyncio.TimeoutError:
+                writer.write(b": ping\n\n")
+            else:
+                writer.write(_sse(event, data))
+                keep = event != "done"
+            await writer.drain()
+    finally:
+        progress_broker.unsubscribe(push)
+
+
 # ── Handler ────────────────────────────────────────────────────────────────────
 
 class Handler(BaseHTTPRequestHandler):
+    detached = False  # la conexión la sigue otro thread (stream SSE): el pool no la toca
+
     def log_message(self, fmt, *args): log.info(f"{self.address_string()} {fmt % args}")
 
+    def handle(self):
+        if isinstance(self.server, PooledHTTPServer):
+            self.close_connection = True
+            self.handle_one_request()  # el keep-alive lo espera el server, sin ocupar el worker
+        else:
+            super().handle()
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        if getattr(self.server, "stopping", False):
+            self.close_connection = True
+
     def send_json(self, status, data):
         body = json.dumps(data, ensure_ascii=False, default=str).encode()
+        gz = None
+        if len(body) >= GZIP_MIN_BYTES and _accepts(self.headers.get("Accept-Encoding", ""), "gzip"):
+            gz = gzip.compress(body, 6)
+        self._send_json_body(status, body, gz)
+
+    def _send_json_body(self, status: int, body: bytes, gz: bytes = None, etag: str = None):
+        use_gz = gz is not None and _accepts(self.headers.get("Accept-Encoding", ""), "gzip")
         self.send_response(status)
         self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Length", str(len(gz if use_gz else body)))
+        if gz is not None:
+            self.send_header("Vary", "Accept-Encoding")
+        if use_gz:
+            self.send_header("Content-Encoding", "gzip")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
         self.end_headers()
-        self.wfile.write(body)
+        self.wfile.write(gz if use_gz else body)
+
+    def send_versioned(self, build):
+        """JSON con db.data_version() (y el día) como ETag: 304 si el cliente ya lo tiene, si no el cuerpo ya comprimido
+        de esta URL. `build()` devuelve (status, data)."""
+        etag = f'W/"{db.data_version()}-{date.today()}"'
+        if self._not_modified(etag, "no-cache"):
+            return
+        hit = _json_cache.get(self.path)
+        if hit is None or hit[0] != etag:
+            status, data = build()
+            if status != 200:
+                self.send_json(status, data)
+                return
+            body = json.dumps(data, ensure_ascii=False, default=str).encode()
+            hit = (etag, body, gzip.compress(body, 6) if len(body) >= GZIP_MIN_BYTES else None)
+            if len(_json_cache) >= _JSON_CACHE_MAX:
+                _json_cache.clear()
+            _json_cache[self.path] = hit
+        self._send_json_body(200, hit[1], hit[2], etag)
+
+    def _not_modified(self, etag: str, cache_control: str) -> bool:
+        tags = {t.strip() for t in self.headers.get("If-None-Match", "").split(",")}
+        if etag not in tags and etag[2:] not in tags and "*" not in tags:
+            return False
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", cache_control)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        return True
 
-    def send_html(self, html):
-        body = html.encode()
+    def send_asset(self, asset: Asset):
+        if self._not_modified(asset.etag, asset.cache_control):
+            return
+        accept = self.headers.get("Accept-Encoding", "")
+        body, encoding = asset.body, None
+        if asset.br is not None and _accepts(accept, "br"):
+            body, encoding = asset.br, "br"
+        elif _accepts(accept, "gzip"):
+            body, encoding = asset.gzip, "gzip"
         self.send_response(200)
-        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Type", asset.content_type)
         self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", asset.etag)
+        self.send_header("Cache-Control", asset.cache_control)
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
         self.end_headers()
         self.wfile.write(body)
 
+    def stream_run_events(self):
+        """/api/run/events en modo threads: el stream sigue en un thread propio, sin ocupar un
+        worker del pool. En modo single bloquearía el server: 503 y el dashboard hace polling."""
+        if not isinstance(self.server, PooledHTTPServer) or not self.server.detach(self.request):
+            self.send_json(503, {"error": "stream no disponible, consultar /api/status"})
+            return
+        self.detached = self.close_connection = True
+        threading.Thread(target=_pump_run_events, args=(self.server, self.request),
+                         name="sse", daemon=True).start()
+
     def read_body(self):
         n = int(self.headers.get("Content-Length", 0))
         return json.loads(self.rfile.read(n)) if n else {}
@@ -550,43 +986,54 @@ class Handler(BaseHTTPRequestHandler):
         p = urlparse(self.path)
         path = p.path
 
-        if path in ("/", ""):
-            db.init()
-            self.send_html(full_html(""))
+        asset = shell_assets().get(path or "/")
+        if asset:
+            self.send_asset(asset)
             return
 
         if path == "/health":
             self.send_json(200, {"ok": True})
             return
 
+        if path == "/api/status":
+            self.send_json(200, {**scrape_status, "breakers": breaker.snapshot()})
+            return
+
         if path == "/api/stats":
-            self.send_json(200, db.get_dashboard_stats())
+            self.send_versioned(lambda: (200, {**db.get_dashboard_stats(), "categories": db.get_categories()}))
             return
 
         if path == "/api/products":
-            params = parse_qs(p.query)
-            active_only = params.get("active", ["1"])[0] != "all"
-            products = db.get_products(active_only=active_only)
-            # Enrich with prices
-            for prod in products:
-                prod["latest_prices"] = db.get_latest_prices(prod["id"])
-                prod["price_history"] = db.get_price_history(prod["id"], days=90)
-            self.send_json(200, products)
+            self.send_versioned(lambda: products_payload(parse_qs(p.query)))
             return
 
         if path.startswith("/api/products/") and path.count("/") == 3:
             pid = int(path.split("/")[-1])
-            prod = db.get_product(pid)
-            if prod:
-                prod["latest_prices"] = db.get_latest_prices(pid)
-                prod["price_history"] = db.get_price_history(pid, days=90)
-                self.send_json(200, prod)
+            self.send_versioned(lambda: product_payload(pid, parse_qs(p.query)))
+            return
+
+        if path == "/api/run":
+            self._handle_run(parse_qs(p.query))
+            return
+
+        if path == "/api/runs":
+            self.send_json(200, db.get_runs())
+            return
+
+        if path.startswith("/api/runs/") and path.count("/") == 3:
+            try:
+                run_id = int(path.split("/")[-1])
+            except ValueError:
+                self.send_json(400, {"error": "id de run inválido"})
+                return
+            if db.run_exists(run_id):
+                self.send_json(200, db.get_run_stats(run_id))
             else:
                 self.send_json(404, {"error": "not found"})
             return
 
-        if path == "/api/run":
-            self._handle_run()
+        if path == "/api/run/events":
+            self.stream_run_events()
             return
 
         self.send_json(404, {"error": "not found"})
@@ -609,7 +1056,7 @@ class Handler(BaseHTTPRequestHandler):
             return
 
         if p.path == "/api/run":
-            self._handle_run()
+            self._handle_run(parse_qs(p.query))
             return
 
         self.send_json(404, {"error": "not found"})
@@ -633,31 +1080,274 @@ class Handler(BaseHTTPRequestHandler):
         else:
             self.send_json(404, {"error": "not found"})
 
-    def _handle_run(self):
-        if scrape_status["running"]:
+    def _handle_run(self, params: dict = None):
+        global _scrape_thread
+        params = params or {}
+        refresh = params.get("refresh", ["0"])[0] == "1"
+        resume = params.get("resume", ["0"])[0] == "1"
+        only_failed = params.get("failed", ["0"])[0] == "1"
+        due = params.get("due", ["1" if SCHEDULED_RUNS else "0"])[0] == "1"
+        crawl = {"1": True, "0": False}.get(params.get("crawl", [""])[0])
+        try:
+            budget = int(params["budget"][0]) if params.get("budget") else None
+        except ValueError:
+            self.send_json(400, {"error": "budget inválido"})
+            return
+        # Con requests concurrentes, el lock evita que dos POST arranquen dos runs
+        if not _run_lock.acquire(blocking=False):
             self.send_json(200, {"status": "already_running"})
             return
+        scrape_status["running"] = True
+        scrape_status["progress"] = None
 
         def bg():
-            scrape_status["running"] = True
+            result = {}
             try:
-                result = asyncio.run(run_all())
+                result = asyncio.run(run_all(refresh_resolutions=refresh, progress=progress_broker.publish,
+                                             resume=resume, only_failed=only_failed, due=due,
+                                             budget=budget, crawl_listings=crawl))
                 scrape_status["last"] = result
                 log.info(f"Scraping completado: {result}")
             except Exception as e:
                 log.error(f"Error en scraping: {e}", exc_info=True)
+                result = {"error": str(e)}
             finally:
+                # running=False antes de publicar "done" (ver _sse_intro)
                 scrape_status["running"] = False
+                _run_lock.release()
+                progress_broker.publish("done", result)
+                db.close()
 
-        threading.Thread(target=bg, daemon=True).start()
+        _scrape_thread = threading.Thread(target=bg, daemon=True)
+        _scrape_thread.start()
         self.send_json(200, {"status": "started"})
 
 
+# ── Serving ────────────────────────────────────────────────────────────────────
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer con un pool de SERVER_WORKERS threads; una conexión keep-alive ociosa espera en un selector, sin ocupar un worker."""
+
+    def __init__(self, address, handler, workers: int = SERVER_WORKERS):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+        self.slots = threading.BoundedSemaphore(workers)
+        self.stopping = False
+        self.streams: set[socket.socket] = set()  # conexiones SSE que viven fuera del pool
+        self._streams_lock = threading.Lock()
+        self._parked: queue.SimpleQueue = queue.SimpleQueue()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._watcher = threading.Thread(target=self._watch_idle, name="keepalive", daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        self._dispatch(request, client_address)
+
+    def _dispatch(self, request, client_address):
+        # Con timeout: si se está apagando no queda bloqueado esperando un worker
+        while not self.slots.acquire(timeout=0.5):
+            if self.stopping:
+                self.shutdown_request(request)
+                return
+        self.pool.submit(self._work, request, client_address)
+
+    def detach(self, request) -> bool:
+        """Saca la conexión del ciclo del pool (la atiende otro thread, que llama a release)."""
+        with self._streams_lock:
+            if self.stopping or len(self.streams) >= SSE_MAX_STREAMS:
+                return False
+            self.streams.add(request)
+            return True
+
+    def release(self, request):
+        with self._streams_lock:
+            self.streams.discard(request)
+        self.shutdown_request(request)
+
+    def _work(self, request, client_address):
+        keep = detached = False
+        try:
+            h = self.RequestHandlerClass(request, client_address, self)
+            keep = not h.close_connection and not self.stopping
+            detached = h.detached
+        except ConnectionError:
+            pass  # el cliente cerró una conexión keep-alive
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.slots.release()
+            if keep:
+                self._parked.put((request, client_address))
+                self._wake_w.send(b"\0")
+            elif not detached:
+                self.shutdown_request(request)
+
+    def _watch_idle(self):
+        """Devuelve al pool las conexiones keep-alive con un request por leer y cierra las que pasan KEEPALIVE_TIMEOUT."""
+        sel = selectors.DefaultSelector()
+        sel.register(self._wake_r, selectors.EVENT_READ)
+        deadlines: dict[socket.socket, float] = {}
+        while not self.stopping:
+            for key, _ in sel.select(timeout=1.0):
+                if key.fileobj is self._wake_r:
+                    self._wake_r.recv(4096)
+                    continue
+                sel.unregister(key.fileobj)
+                del deadlines[key.fileobj]
+                self._dispatch(key.fileobj, key.data)
+            while not self._parked.empty():
+                request, client_address = self._parked.get()
+                sel.register(request, selectors.EVENT_READ, client_address)
+                deadlines[request] = time.monotonic() + KEEPALIVE_TIMEOUT
+            now = time.monotonic()
+            for request in [r for r, t in deadlines.items() if t <= now]:
+                sel.unregister(request)
+                del deadlines[request]
+                self.shutdown_request(request)
+        for request in deadlines:
+            self.shutdown_request(request)
+        sel.close()
+
+    def graceful_stop(self):
+        """Deja de aceptar conexiones y espera a que terminen los requests en curso; las
+        conexiones keep-alive se cierran después de su request actual o, si están ociosas, ya."""
+        with self._streams_lock:
+            self.stopping = True
+            streams = list(self.streams)
+        for request in streams:
+            try:
+                request.shutdown(socket.SHUT_RDWR)  # su thread termina en el próximo write
+            except OSError:
+                pass
+        self._wake_w.send(b"\0")
+        self.shutdown()
+        self.server_close()
+        self.pool.shutdown(wait=True)
+        self._watcher.join()
+        while not self._parked.empty():
+            self.shutdown_request(self._parked.get()[0])
+
+
+def _handle_raw(raw: bytes, client_address) -> tuple[bytes, bool]:
+    """Pasa un request ya leído completo por Handler sobre buffers en memoria.
+    Devuelve (respuesta, mantener la conexión abierta)."""
+    h = Handler.__new__(Handler)
+    h.request, h.server, h.client_address = None, None, client_address
+    h.rfile, h.wfile = io.BytesIO(raw), io.BytesIO()
+    h.close_connection = True
+    try:
+        h.handle_one_request()
+    except Exception as e:
+        log.error(f"Error atendiendo request de {client_address[0]}: {e}", exc_info=True)
+        if not h.wfile.tell():
+            return b"HTTP/1.1 500 Internal Server Error\r\nContent-Length: 0\r\nConnection: close\r\n\r\n", False
+        return h.wfile.getvalue(), False
+    return h.wfile.getvalue(), not h.close_connection
+
+
+def _content_length(head: bytes) -> int:
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            return int(value.strip() or 0)
+    return 0
+
+
+async def serve_asyncio(port: int):
+    """Las conexiones (y su keep-alive) viven en el event loop sin ocupar threads; solo el
+    request ya leído pasa por Handler en un pool de SERVER_WORKERS threads."""
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=SERVER_WORKERS, thread_name_prefix="http")
+    conns: set[asyncio.Task] = set()
+    idle: set[asyncio.Task] = set()
+    stop = asyncio.Event()
+
+    async def serve_conn(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        conns.add(task)
+        peer = writer.get_extra_info("peername") or ("-", 0)
+        try:
+            while not stop.is_set():
+                idle.add(task)
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                finally:
+                    idle.discard(task)
+                if head.split(b" ", 2)[1].split(b"?")[0] == b"/api/run/events":
+                    await stream_run_events(writer)
+                    break
+                n = _content_length(head)
+                body = await asyncio.wait_for(reader.readexactly(n), REQUEST_TIMEOUT) if n else b""
+                try:
+                    response, keep = await asyncio.wait_for(
+                        loop.run_in_executor(pool, _handle_raw, head + body, peer), REQUEST_TIMEOUT)
+                except asyncio.TimeoutError:
+                    log.warning(f"Request de {peer[0]} excedió {REQUEST_TIMEOUT:.0f}s")
+                    response, keep = b"HTTP/1.1 504 Gateway Timeout\r\nContent-Length: 0\r\nConnection: close\r\n\r\n", False
+                writer.write(response)
+                await writer.drain()
+                if not keep:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass
+        finally:
+            conns.discard(task)
+            writer.close()
+
+    server = await asyncio.start_server(serve_conn, "0.0.0.0", port)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    log.info("Apagando: no se aceptan conexiones nuevas")
+    server.close()
+    for task in list(idle):
+        task.cancel()
+    if conns:
+        _, pending = await asyncio.wait(list(conns), timeout=SHUTDOWN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def serve_threads(port: int):
+    httpd = PooledHTTPServer(("0.0.0.0", port), Handler)
+    # shutdown() espera al loop de serve_forever, así que no puede correr en el mismo thread
+    stopper = threading.Thread(target=httpd.graceful_stop)
+
+    def on_signal(*_):
+        if not httpd.stopping:
+            log.info("Apagando: esperando los requests en curso")
+            stopper.start()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    httpd.serve_forever()
+    stopper.join()
+
+
 def main():
     port = int(os.environ.get("PORT", 8080))
     db.init()
-    log.info(f"🚀 RetailScope en http://0.0.0.0:{port}")
-    HTTPServer(("0.0.0.0", port), Handler).serve_forever()
+    shell_assets()  # render y compresión una sola vez, antes del primer request
+    log.info(f"🚀 RetailScope en http://0.0.0.0:{port} (modo {SERVER_MODE})")
+    if SERVER_MODE == "single":
+        HTTPServer(("0.0.0.0", port), Handler).serve_forever()
+        return
+    # HTTP/1.1: conexiones persistentes; una conexión ociosa se cierra a los KEEPALIVE_TIMEOUT s.
+    # El handler solo lee sockets que ya tienen un request, así que su timeout es el del request
+    Handler.protocol_version = "HTTP/1.1"
+    Handler.timeout = REQUEST_TIMEOUT
+    if SERVER_MODE == "asyncio":
+        asyncio.run(serve_asyncio(port))
+    else:
+        serve_threads(port)
+    if _scrape_thread and _scrape_thread.is_alive():
+        log.info("Esperando al scraping en curso para guardar lo pendiente")
+        _scrape_thread.join(SHUTDOWN_TIMEOUT)
 
 
 if __name__ == "__main__":
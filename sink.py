@@ -0,0 +1,117 @@
+import os
+import asyncio
+import logging
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from scrapers.base import ProductPrice
+import db
+
+log = logging.getLogger(__name__)
+
+# Filas de precio por transacción
+FLUSH_ROWS = int(os.environ.get("SINK_FLUSH_ROWS", 500))
+# Segundos máximos que un resultado espera en el buffer antes de escribirse
+FLUSH_INTERVAL = float(os.environ.get("SINK_FLUSH_INTERVAL", 2))
+# Productos en el buffer; con el buffer lleno put() espera (backpressure sobre el scraping)
+MAX_PENDING = int(os.environ.get("SINK_MAX_PENDING", 1000))
+
+_STOP = object()
+
+
+class PriceSink:
+    """Write-behind de un run: put() encola y un thread guarda en lotes con db.save_prices_many. Usar como
+    `async with PriceSink() as sink:`; on_write(product_id, prices, saved) se llama tras cada commit."""
+
+    def __init__(self, flush_rows: int = FLUSH_ROWS, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING,
+                 on_write: Callable[[int, list[ProductPrice], bool], None] = None):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.on_write = on_write
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="price-sink")
+        self._writer: asyncio.Task | None = None
+        self.flushes = 0
+        self.rows = 0
+        self.failed = 0
+
+    async def __aenter__(self):
+        self._writer = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def put(self, product_id: int, prices: list[ProductPrice], tasks: list[tuple] = None):
+        """Encola los precios de un producto y, opcionalmente, los resultados de sus tareas del
+        ledger (db.record_tasks), que se confirman en la misma transacción que los precios."""
+        await self.queue.put((product_id, prices, tasks or []))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is _STOP:
+                return
+            batch, rows = [item], len(item[1])
+            deadline = loop.time() + self.flush_interval
+            stop = False
+            while rows < self.flush_rows:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+                rows += len(item[1])
+            await loop.run_in_executor(self._executor, self._write, batch)
+            if stop:
+                return
+
+    def _write(self, batch: list[tuple[int, list[ProductPrice], list[tuple]]]):
+        """Corre en el thread del sink. Si la transacción del lote falla se reintenta producto
+        por producto, para no perder todo el lote por una fila."""
+        failed = set()
+        try:
+            db.save_prices_many([(pid, prices) for pid, prices, _ in batch],
+                                tasks=[t for _, _, tasks in batch for t in tasks])
+        except Exception as e:
+            log.warning(f"Falló el guardado de {len(batch)} productos en lote ({e}); reintentando uno por uno")
+            for product_id, prices, tasks in batch:
+                try:
+                    db.save_prices_many([(product_id, prices)], tasks=tasks)
+                except Exception as e:
+                    failed.add(product_id)
+                    log.error(f"  No se pudieron guardar los precios del producto {product_id}: {e}")
+        self.failed += len(failed)
+        self.flushes += 1
+        self.rows += sum(len(prices) for product_id, prices, _ in batch if product_id not in failed)
+        if self.on_write:
+            for product_id, prices, _ in batch:
+                try:
+                    self.on_write(product_id, prices, product_id not in failed)
+                except Exception as e:
+                    log.warning(f"on_write falló para el producto {product_id}: {e}")
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        try:
+            if self._writer and not self._writer.done():
+                await self.queue.put(_STOP)
+                await self._writer
+        finally:
+            # Lo que quedó en el buffer (p. ej. si el writer fue cancelado) se escribe igual
+            rest = []
+            while not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is not _STOP:
+                    rest.append(item)
+            if rest:
+                await loop.run_in_executor(self._executor, self._write, rest)
+            await loop.run_in_executor(self._executor, db.close)
+            self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {"flushes": self.flushes, "rows": self.rows, "failed_products": self.failed}
@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """Base vacía en un directorio temporal; la conexión del thread se cierra al terminar."""
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+    db.close()
+    db._store_ids.clear()
+    yield tmp_path / "test.db"
+    db.close()
@@ -0,0 +1,74 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from scrapers import base, breaker
+
+
+def test_cycle_with_a_single_probe():
+    b = breaker.CircuitBreaker("x", window=10, min_calls=4, error_rate=0.5, cooldown=60)
+    for ok in (True, False, True):
+        b.record_success() if ok else b.record_failure()
+    assert b.state == breaker.CLOSED
+    b.record_failure()  # 2 de 4 fallidos
+    assert b.state == breaker.OPEN
+    with pytest.raises(breaker.CircuitOpenError):
+        b.before_call()
+
+    b.opened_at -= 60  # pasó el cooldown
+    assert b.state == breaker.HALF_OPEN
+    assert b.before_call() is True
+    with pytest.raises(breaker.CircuitOpenError):
+        b.before_call()  # ya hay una sonda en vuelo
+    b.record_failure(probe=True)
+    assert b.state == breaker.OPEN and b.trips == 2
+
+    b.opened_at -= 60
+    assert b.before_call() is True
+    b.record_success(probe=True)
+    assert b.state == breaker.CLOSED and not b.probing
+    assert b.before_call() is False
+
+
+def test_timeouts_trip_the_circuit():
+    b = breaker.CircuitBreaker("x", min_calls=100, max_timeouts=2)
+    b.record_failure(timeout=True)
+    b.record_failure(timeout=True)
+    assert b.state == breaker.OPEN
+
+
+def test_cancelled_call_does_not_free_the_probe(monkeypatch):
+    circuit = breaker.CircuitBreaker("paris", cooldown=0)
+    monkeypatch.setitem(breaker._breakers, "paris", circuit)
+    monkeypatch.setattr(base.ratelimit, "bucket", lambda key: None)
+
+    async def handler(request):
+        await asyncio.sleep(10)  # respuesta que nunca llega a tiempo
+
+    @asynccontextmanager
+    async def client_for(url):
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            yield client
+
+    monkeypatch.setattr(base, "client_for", client_for)
+    url = "https://www.paris.cl/api/x"
+
+    async def scenario():
+        before = asyncio.create_task(base.fetch(url))  # salió con el circuito cerrado
+        await asyncio.sleep(0)
+        circuit._trip()  # cooldown 0: queda en half-open
+        probe = asyncio.create_task(base.fetch(url))
+        await asyncio.sleep(0)
+        assert circuit.probing
+        before.cancel()
+        await asyncio.gather(before, return_exceptions=True)
+        assert circuit.probing  # la llamada cancelada no era la sonda
+        with pytest.raises(breaker.CircuitOpenError):
+            await base.fetch(url)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        assert not circuit.probing
+
+    asyncio.run(scenario())
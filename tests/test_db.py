@@ -0,0 +1,107 @@
+import sqlite3
+
+import db
+
+# Layout de la base antes de la migración compacta (store texto, date ISO, precios REAL)
+BASELINE_SCHEMA = """
+    CREATE TABLE products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        category TEXT DEFAULT '',
+        is_own INTEGER DEFAULT 0,
+        search_query TEXT DEFAULT '',
+        urls TEXT DEFAULT '{}',
+        active INTEGER DEFAULT 1,
+        created_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE TABLE prices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+        date TEXT NOT NULL,
+        store TEXT NOT NULL,
+        price REAL,
+        original_price REAL,
+        url TEXT,
+        sku TEXT,
+        error TEXT,
+        scraped_at TEXT DEFAULT (datetime('now'))
+    );
+    CREATE INDEX idx_prices_product_date ON prices(product_id, date);
+    CREATE INDEX idx_prices_date ON prices(date);
+"""
+
+
+def _baseline_db(path):
+    c = sqlite3.connect(path)
+    c.executescript(BASELINE_SCHEMA)
+    c.execute("INSERT INTO products (name) VALUES ('Taladro')")
+    c.executemany("INSERT INTO prices (product_id, date, store, price, original_price) VALUES (1, ?, ?, ?, ?)", [
+        ("2024-01-01", "Falabella", 19990.0, None),
+        ("2024-01-02", "Falabella", 17990.0, 19990.0),
+        ("2024-01-02", "Paris", 18990.0, None),
+    ])
+    c.commit()
+    c.close()
+
+
+def test_statements_ignores_semicolons_in_comments():
+    stmts = db._statements("-- uno; dos\nCREATE TABLE a (x);\n/* ; */ CREATE TABLE b (y);\n")
+    assert len(stmts) == 2
+
+
+def test_init_migrates_baseline_db(tmp_db):
+    _baseline_db(tmp_db)
+    db.init()
+    c = db.conn()
+    assert not db._is_legacy_schema(c)
+    assert c.execute("SELECT value FROM meta WHERE key='schema_version'").fetchone()[0] == str(db.SCHEMA_VERSION)
+    assert {r[0] for r in c.execute("SELECT name FROM stores")} == {"Falabella", "Paris"}
+    latest = {r["store"]: r for r in db.get_latest_prices(1)}
+    assert latest["Falabella"]["price"] == 17990.0
+    assert latest["Falabella"]["original_price"] == 19990.0
+    assert latest["Falabella"]["date"] == "2024-01-02"
+    assert [r["price"] for r in db.get_raw_prices(1, store="Falabella", days=100000)] == [19990.0, 17990.0]
+    # Una segunda init sobre la base ya migrada no hace nada
+    db.init()
+    assert c.execute("SELECT COUNT(*) FROM prices").fetchone()[0] == 3
+
+
+def test_history_bulk_unknown_store_is_read_only(tmp_db):
+    _baseline_db(tmp_db)
+    db.init()
+    assert [r["price"] for r in db.get_price_history_bulk([1], store="Paris", days=100000)[1]] == [18990.0]
+    assert db.get_price_history_bulk([1], store="Ripley", days=100000) == {}
+    assert db.conn().execute("SELECT COUNT(*) FROM stores WHERE name='Ripley'").fetchone()[0] == 0
+
+
+def test_columnar_history_aligns_stores():
+    rows = [(1, 10, 1, 1000, None), (1, 10, 2, 900, None), (1, 11, 2, 950, None), (1, 12, 1, 1100, None),
+            (2, 11, 1, 500, None)]
+    out = db._columnar_history(rows, {1: "Paris", 2: "Easy"})
+    scale = db.PRICE_SCALE
+    assert out[1]["dates"] == [db._date_str(10), db._date_str(11), db._date_str(12)]
+    assert out[1]["series"] == {"Paris": [1000 / scale, None, 1100 / scale], "Easy": [900 / scale, 950 / scale, None]}
+    assert out[2] == {"dates": [db._date_str(11)], "series": {"Paris": [500 / scale]}}
+
+
+def test_columnar_history_merges_rollups(tmp_db):
+    from datetime import date, timedelta
+    from scrapers.base import ProductPrice
+
+    db.init()
+    pid = db.add_product("Taladro")
+    today = date.today()
+    for days, store, price in [(120, "Paris", 100.0), (120, "Easy", 90.0), (3, "Paris", 95.0), (2, "Easy", 85.0)]:
+        db.save_prices(pid, [ProductPrice(store=store, product_name="Taladro", url="", price=price,
+                                          date=str(today - timedelta(days=days)))])
+    db.prune_history(raw_days=30, weekly_days=365, vacuum=False)
+
+    rows = db.get_price_history_bulk([pid], days=400)[pid]
+    columnar = db.get_price_history_bulk([pid], days=400, columnar=True)[pid]
+    # La semana de hace 120 días sale de price_rollup, los últimos días de price_daily
+    assert len(columnar["dates"]) == 3 and db._since(120) - 6 <= db._day(columnar["dates"][0]) <= db._since(120)
+    assert columnar["series"] == {"Paris": [100.0, 95.0, None], "Easy": [90.0, None, 85.0]}
+    # Mismo contenido que el formato por filas
+    assert sorted((r["date"], r["store"], r["price"]) for r in rows) == sorted(
+        (d, store, p) for store, series in columnar["series"].items()
+        for d, p in zip(columnar["dates"], series) if p is not None)
@@ -0,0 +1,54 @@
+import db
+
+
+def _run(tasks):
+    db.init()
+    for name in ("Taladro", "Sierra"):
+        db.add_product(name)
+    return db.start_run(tasks)
+
+
+def test_lease_is_exclusive(tmp_db):
+    run_id = _run([(1, "falabella"), (1, "paris"), (2, "falabella")])
+    assert db.lease_tasks(run_id, "a", 10, 300) == {1: {"falabella", "paris"}, 2: {"falabella"}}
+    assert db.lease_tasks(run_id, "b", 10, 300) == {}
+    assert db.leased_tasks(run_id) == 3
+    assert db.run_exists(run_id) and not db.run_exists(run_id + 1)
+
+
+def test_expired_lease_is_reclaimed_up_to_max(tmp_db):
+    run_id = _run([(1, "falabella"), (2, "falabella")])
+    # Lease ya vencido: como un worker que murió con sus tareas
+    assert db.lease_tasks(run_id, "a", 1, -1, max_leases=2) == {1: {"falabella"}}
+    assert db.leased_tasks(run_id) == 0
+    assert db.lease_tasks(run_id, "b", 10, -1, max_leases=2) == {1: {"falabella"}, 2: {"falabella"}}
+    # La tarea 1 ya venció dos veces: queda pendiente para un --resume
+    assert db.lease_tasks(run_id, "c", 10, 300, max_leases=2) == {2: {"falabella"}}
+    assert db.finish_run(run_id) == "partial"
+
+
+def test_run_products_counts_each_product_once(tmp_db):
+    run_id = _run([(1, "falabella"), (1, "paris"), (2, "falabella")])
+    # Las dos tiendas del producto 1 las terminaron leases distintos
+    db.record_tasks([(run_id, 1, "falabella", "ok", None, 10)])
+    db.record_tasks([(run_id, 1, "paris", "error", "timeout", 10)])
+    assert db.run_products(run_id) == 1
+    assert db.lease_tasks(run_id, "a", 10, 300) == {2: {"falabella"}}
+
+
+def test_resume_closes_tasks_of_deactivated_products(tmp_db):
+    import main
+
+    db.init()
+    for name in ("Taladro", "Sierra"):
+        db.add_product(name, urls={"paris": f"https://www.paris.cl/{name.lower()}"})
+    run_id = db.start_run([(1, "paris"), (2, "paris")])
+    db.record_tasks([(run_id, 2, "paris", "ok", None, 10)])
+    db.update_product(1, active=0)
+
+    run = main.ScrapeRun()
+    assert main.open_run(main.load_products(), run, resume=True, only_failed=False)[0] == run_id
+    assert db.get_run_tasks(run_id, "pending") == {}
+    assert db.get_run_tasks(run_id, "error") == {1: {"paris"}}
+    assert db.finish_run(run_id) == "done"
+    assert db.resumable_run() is None
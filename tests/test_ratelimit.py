@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from scrapers import ratelimit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(round(seconds, 3))
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", c.monotonic)
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", c.sleep)
+    return c
+
+
+def test_bucket_burst_then_rate(clock):
+    b = ratelimit.TokenBucket(rate=2, burst=2)
+
+    async def take(n):
+        for _ in range(n):
+            await b.acquire()
+
+    asyncio.run(take(4))
+    assert clock.slept == [0.5, 0.5]  # la ráfaga sale al tiro, después 2 por segundo
+    clock.now += 10  # en reposo se recarga hasta burst, no más
+    clock.slept.clear()
+    asyncio.run(take(3))
+    assert clock.slept == [0.5]
+
+
+def test_pause_holds_the_next_acquire(clock):
+    b = ratelimit.TokenBucket(rate=5, burst=5)
+    b.pause(3)
+    asyncio.run(b.acquire())
+    assert clock.slept == [3.0]
+
+
+def test_share_splits_rate_between_processes(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_buckets", {})
+    ratelimit.configure("paris", 6, 12)
+    ratelimit.share(3)
+    b = ratelimit.bucket("paris")
+    assert (b.rate, b.burst) == (2, 4)
+
+
+def test_retry_after():
+    assert ratelimit.retry_after("5") == 5
+    assert ratelimit.retry_after("-1") == 0
+    assert ratelimit.retry_after("99999") == ratelimit.BACKOFF_MAX
+    assert ratelimit.retry_after("pronto") is None
+    assert ratelimit.retry_after(None) is None
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10), usegmt=True)
+    assert 8 <= ratelimit.retry_after(when) <= 10
+
+
+def test_backoff_is_bounded():
+    for attempt in range(10):
+        assert 0 <= ratelimit.backoff(attempt) <= min(ratelimit.BACKOFF_MAX, ratelimit.BACKOFF_BASE * 2 ** attempt)
+
+
+def test_retry_after_pauses_the_store(clock):
+    import httpx
+    from scrapers import base
+
+    responses = [httpx.Response(429, headers={"Retry-After": "2"}), httpx.Response(200, json={})]
+
+    class Client:
+        async def get(self, url, params=None, headers=None):
+            return responses.pop(0)
+
+    b = ratelimit.TokenBucket(rate=10, burst=10)
+    r = asyncio.run(base._get_with_retries(Client(), "https://x.cl", None, {}, b, None))
+    assert r.status_code == 200
+    assert clock.slept == [2.0]  # el reintento esperó el Retry-After en el bucket de la tienda
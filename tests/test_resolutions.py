@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+import main
+from scrapers.base import ProductPrice
+
+URL = "https://www.paris.cl/taladro"
+
+
+def _store(error):
+    async def scrape_url(url, name=""):
+        return ProductPrice(store="Paris", product_name=name, url=url, price=None, error=error)
+
+    async def search(query, limit=5):
+        return [ProductPrice(store="Paris", product_name=query, url=URL + "-nuevo", price=990.0)]
+
+    return SimpleNamespace(STORE="Paris", scrape_url=scrape_url, search=search)
+
+
+def _scrape(monkeypatch, error):
+    dropped = []
+    monkeypatch.setattr(main.db, "delete_resolutions", lambda *a: dropped.append(a))
+    monkeypatch.setattr(main.db, "save_resolution", lambda *a: None)
+    product = {"id": 1, "name": "Taladro", "search_query": "taladro", "urls": {"paris": URL},
+               "resolved_stores": ["paris"]}
+    r = asyncio.run(main._scrape_store("paris", _store(error), product, main.ScrapeRun()))
+    return r, dropped
+
+
+def test_transient_error_keeps_resolution(monkeypatch):
+    for error in ("Server error '503 Service Unavailable' for url", "Circuito abierto para paris", "ReadTimeout"):
+        r, dropped = _scrape(monkeypatch, error)
+        assert dropped == [] and r.url == URL and r.error == error
+
+
+def test_missing_product_is_resolved_again(monkeypatch):
+    r, dropped = _scrape(monkeypatch, "Client error '404 Not Found' for url")
+    assert dropped == [(1, "paris")]
+    assert r.url == URL + "-nuevo" and r.price == 990.0
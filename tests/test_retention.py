@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+
+import db
+from scrapers.base import ProductPrice
+
+
+def _seed():
+    db.init()
+    pid = db.add_product("Taladro")
+    today = date.today()
+    # Martes y miércoles de una misma semana: hace ~6 meses (a mitad de mes) y hace ~60 días
+    month = (today.replace(day=1) - timedelta(days=180)).replace(day=8)
+    month += timedelta(days=(1 - month.weekday()) % 7)
+    week = today - timedelta(days=60)
+    week -= timedelta(days=(week.weekday() - 1) % 7)
+    history = [(month, 100.0), (month + timedelta(days=1), 80.0), (week, 90.0), (week + timedelta(days=1), 95.0),
+               (today - timedelta(days=5), 70.0)]
+    for day, price in history:
+        db.save_prices(pid, [ProductPrice(store="Paris", product_name="Taladro", url="", price=price, date=str(day))])
+    return pid
+
+
+def _rollup(period):
+    return db.conn().execute("SELECT day, min_price, max_price, last_price, samples FROM price_rollup "
+                             "WHERE period=? ORDER BY day", (period,)).fetchall()
+
+
+def test_prune_rolls_up_and_deletes_raw_rows(tmp_db):
+    pid = _seed()
+    out = db.prune_history(raw_days=30, weekly_days=90, vacuum=False)
+    assert out["raw_deleted"] == 4
+    assert out["daily_to_weekly"] == 2 and out["weekly_to_monthly"] == 1
+
+    c = db.conn()
+    horizon = db._horizon(c)
+    assert horizon <= db._since(30) and (horizon + 3) % 7 == 0  # un lunes
+    assert c.execute("SELECT MIN(day) FROM price_daily").fetchone()[0] == db._since(5)
+    # Lo de hace ~60 días queda por semana; lo de hace ~200 días, por mes
+    (weekly,), (monthly,) = _rollup("week"), _rollup("month")
+    scale = db.PRICE_SCALE
+    assert tuple(weekly)[1:] == (90 * scale, 95 * scale, 95 * scale, 2)
+    assert tuple(monthly)[1:] == (80 * scale, 100 * scale, 80 * scale, 2)
+    assert db._date_str(monthly["day"]).endswith("-01")
+    # El último precio no se toca
+    assert db.get_latest_prices(pid)[0]["price"] == 70.0
+    assert db.check_latest_prices() == []
+
+    again = db.prune_history(raw_days=30, weekly_days=90, vacuum=False)
+    assert again["daily_to_weekly"] == again["raw_deleted"] == again["weekly_to_monthly"] == 0
+    assert len(_rollup("week")) == len(_rollup("month")) == 1
+
+
+def test_prune_deletes_old_runs(tmp_db):
+    _seed()
+    old, recent = db.start_run([(1, "paris")]), db.start_run([(1, "paris")])
+    db.conn().execute("UPDATE scrape_runs SET started_at = started_at - 400 * 86400 WHERE id=?", (old,))
+    db.conn().commit()
+    assert db.prune_history(vacuum=False)["runs_deleted"] == 1
+    assert not db.run_exists(old) and db.run_exists(recent)
+    assert db.get_run_tasks(old) == {}
@@ -0,0 +1,66 @@
+import db
+from scrapers import ProductPrice
+
+
+def _price(day, price, error=None):
+    return ProductPrice(store="Paris", product_name="Taladro", url="https://www.paris.cl/taladro",
+                        price=price, date=f"2024-03-{day:02d}", error=error)
+
+
+def _runs():
+    return [(r["valid_from"], r["valid_to"], r["price"]) for r in db.conn().execute(
+        "SELECT valid_from, valid_to, price FROM price_runs ORDER BY valid_from")]
+
+
+def _daily():
+    return db.conn().execute("SELECT day, min_price, max_price, last_price FROM price_daily ORDER BY day").fetchall()
+
+
+def _setup():
+    db.init()
+    pid = db.add_product("Taladro")
+    for day, price in [(1, 100.0), (2, 100.0), (2, 100.0), (3, 90.0), (4, 90.0)]:
+        db.save_prices(pid, [_price(day, price)])
+    return pid
+
+
+def test_migrate_collapses_consecutive_prices(tmp_db):
+    pid = _setup()
+    daily = [tuple(r) for r in _daily()]
+    assert db.migrate_to_rle() == 2
+    assert db.storage_mode() == "rle"
+    d1 = db._day("2024-03-01")
+    assert _runs() == [(d1, d1 + 1, 100 * db.PRICE_SCALE), (d1 + 2, d1 + 3, 90 * db.PRICE_SCALE)]
+    assert db.conn().execute("SELECT COUNT(*) FROM prices").fetchone()[0] == 0
+    assert db.check_latest_prices() == []
+    assert db.get_latest_prices(pid)[0]["price"] == 90.0
+    # price_daily se reconstruye igual desde los intervalos
+    assert db.backfill_price_daily() == 4
+    assert [tuple(r) for r in _daily()] == daily
+    assert db.migrate_to_rle() == 0
+
+
+def test_rle_save_extends_or_opens_runs(tmp_db):
+    pid = _setup()
+    db.migrate_to_rle()
+    db.save_prices(pid, [_price(5, 90.0)])  # mismo estado: se extiende el intervalo
+    assert len(_runs()) == 2
+    db.save_prices(pid, [_price(6, None, error="timeout")])  # error: intervalo nuevo
+    db.save_prices(pid, [_price(7, 80.0)])
+    d1 = db._day("2024-03-01")
+    assert _runs() == [(d1, d1 + 1, 100 * db.PRICE_SCALE), (d1 + 2, d1 + 4, 90 * db.PRICE_SCALE),
+                       (d1 + 5, d1 + 5, None), (d1 + 6, d1 + 6, 80 * db.PRICE_SCALE)]
+    assert db.check_latest_prices() == []
+    # Reconstruir latest_prices desde los intervalos da lo mismo que mantenerlo al guardar
+    assert db.backfill_latest_prices() == 1
+    assert db.get_latest_prices(pid)[0]["price"] == 80.0
+    assert len(_daily()) == 6
+    assert db.backfill_price_daily() == 6
+
+
+def test_rewrites_invalidate_the_data_version(tmp_db):
+    _setup()
+    for rewrite in (db.migrate_to_rle, db.backfill_latest_prices, db.backfill_price_daily):
+        version = db.data_version()
+        rewrite()
+        assert db.data_version() > version
@@ -0,0 +1,59 @@
+import pytest
+
+import scheduler
+
+
+def test_priority_without_history_is_max():
+    assert scheduler.priority(None, False) == 1.0
+    assert scheduler.priority({"days": 1, "changes": 0, "promo": False}, False) == 1.0
+
+
+def test_priority_signals():
+    stable = {"days": 30, "changes": 0, "promo": False}
+    assert scheduler.priority(stable, False) == 0.0
+    assert scheduler.priority(stable, True) == scheduler.W_OWN
+    assert scheduler.priority({**stable, "promo": True}, False) == scheduler.W_PROMO
+    assert scheduler.priority({"days": 30, "changes": 29, "promo": False}, False) == 1.0
+
+
+def test_priority_min_days_one(monkeypatch):
+    # Con un solo día no hay días consecutivos: no debe dividir por cero
+    monkeypatch.setattr(scheduler, "MIN_DAYS", 1)
+    assert scheduler.priority({"days": 1, "changes": 0, "promo": False}, False) == 0.0
+
+
+def test_interval_bounds():
+    assert scheduler.interval(0.0) == pytest.approx(scheduler.MAX_INTERVAL_H * 3600)
+    assert scheduler.interval(1.0) == pytest.approx(scheduler.MIN_INTERVAL_H * 3600)
+
+
+def test_due_tasks_order_and_budget(monkeypatch):
+    now = 1_000_000_000
+    stable = {"days": 30, "changes": 0, "promo": False}
+    signals = {(1, "Falabella"): stable, (2, "Falabella"): stable, (3, "Falabella"): stable}
+    schedule = {
+        (1, "falabella"): {"last_scraped": now - 3600, "last_status": "ok"},  # al día
+        (2, "falabella"): {"last_scraped": now - 400 * 3600, "last_status": "ok"},  # atrasado
+    }
+    saved = []
+    monkeypatch.setattr(scheduler.db, "get_schedule_signals", lambda days: signals)
+    monkeypatch.setattr(scheduler.db, "get_schedule", lambda: schedule)
+    monkeypatch.setattr(scheduler.db, "update_schedule", saved.extend)
+    candidates = [({"id": pid}, "falabella") for pid in (1, 2, 3)] + [({"id": 4, "is_own": 1}, "paris")]
+
+    tasks, summary = scheduler.due_tasks(candidates, budget=2, now=now)
+    # El nunca scrapeado sin señales (prioridad 1) y el más atrasado; el resto queda para después
+    assert tasks == {4: {"paris"}, 2: {"falabella"}}
+    assert summary == {"candidates": 4, "due": 3, "scheduled": 2, "deferred": 1}
+    assert len(saved) == 4
+
+
+def test_due_tasks_zero_retry(monkeypatch):
+    now = 1_000_000_000
+    monkeypatch.setattr(scheduler, "RETRY_H", 0)
+    monkeypatch.setattr(scheduler.db, "get_schedule_signals", lambda days: {})
+    monkeypatch.setattr(scheduler.db, "get_schedule",
+                        lambda: {(1, "falabella"): {"last_scraped": now - 60, "last_status": "error"}})
+    monkeypatch.setattr(scheduler.db, "update_schedule", lambda rows: None)
+    tasks, _ = scheduler.due_tasks([({"id": 1}, "falabella")], budget=5, now=now)
+    assert tasks == {1: {"falabella"}}
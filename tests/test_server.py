@@ -0,0 +1,13 @@
+import server
+
+
+def test_accepts_encoding():
+    assert server._accepts("gzip, br", "br")
+    assert not server._accepts("gzip;q=0, br", "gzip")
+    assert server._accepts("*;q=0.5", "gzip")
+    assert not server._accepts("br, *;q=0", "gzip")
+    assert not server._accepts("identity", "gzip")
+
+
+def test_accepts_malformed_q():
+    assert server._accepts("gzip;q=abc", "gzip")
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from scrapers.singleflight import SingleFlight
+
+
+def test_identical_calls_share_one_request():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"price": 100}
+
+    async def scenario():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do(("url", "paris", "x"), fetch) for _ in range(3)))
+        late = await flights.do(("url", "paris", "x"), fetch)  # ya terminada: mismo resultado
+        other = await flights.do(("url", "paris", "y"), fetch)
+        return flights, results, late, other
+
+    flights, results, late, other = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert results == [{"price": 100}] * 3 and late is results[0] and other == {"price": 100}
+    assert flights.saved == 3
+
+
+def test_exception_is_shared():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("HTTP 503")
+
+    async def scenario():
+        flights = SingleFlight()
+        return await asyncio.gather(*(flights.do("k", fetch) for _ in range(2)), return_exceptions=True)
+
+    a, b = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert isinstance(a, RuntimeError) and a is b
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def scenario():
+        flights = SingleFlight()
+        first = asyncio.create_task(flights.do("k", fetch))
+        second = asyncio.create_task(flights.do("k", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "ok"
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+import db
+from scrapers.base import ProductPrice
+from sink import PriceSink
+
+
+def _prices(price):
+    return [ProductPrice(store="Paris", product_name="Taladro", url="", price=price, date="2024-03-01")]
+
+
+def _products(n):
+    db.init()
+    return [db.add_product(f"Producto {i}") for i in range(n)]
+
+
+def test_flushes_pending_on_exit(tmp_db):
+    pids = _products(3)
+    written = []
+
+    async def scenario():
+        # Ni el tamaño ni el intervalo alcanzan a disparar un flush: se escribe todo al salir
+        async with PriceSink(flush_rows=100, flush_interval=60, on_write=lambda *a: written.append(a)) as sink:
+            for i, pid in enumerate(pids):
+                await sink.put(pid, _prices(100.0 + i))
+        return sink
+
+    sink = asyncio.run(scenario())
+    assert sink.stats() == {"flushes": 1, "rows": 3, "failed_products": 0}
+    assert [(pid, saved) for pid, _, saved in written] == [(pid, True) for pid in pids]
+    assert [db.get_latest_prices(pid)[0]["price"] for pid in pids] == [100.0, 101.0, 102.0]
+
+
+def test_error_in_run_propagates_after_writing(tmp_db):
+    pid, = _products(1)
+
+    async def scenario():
+        async with PriceSink(flush_interval=60) as sink:
+            await sink.put(pid, _prices(100.0))
+            raise RuntimeError("scraping cortado")
+
+    with pytest.raises(RuntimeError, match="scraping cortado"):
+        asyncio.run(scenario())
+    assert db.get_latest_prices(pid)[0]["price"] == 100.0
+
+
+def test_failed_product_does_not_lose_the_batch(tmp_db, monkeypatch):
+    good, bad = _products(2)
+    save = db.save_prices_many
+
+    def flaky(batch, tasks=None):
+        if any(pid == bad for pid, _ in batch):
+            raise RuntimeError("disk I/O error")
+        return save(batch, tasks)
+
+    monkeypatch.setattr(db, "save_prices_many", flaky)
+    written = {}
+
+    async def scenario():
+        async with PriceSink(on_write=lambda pid, prices, saved: written.update({pid: saved})) as sink:
+            await sink.put(good, _prices(100.0))
+            await sink.put(bad, _prices(200.0))
+        return sink
+
+    sink = asyncio.run(scenario())
+    assert written == {good: True, bad: False}
+    assert sink.stats()["failed_products"] == 1
+    assert db.get_latest_prices(good)[0]["price"] == 100.0
+    assert db.get_latest_prices(bad) == []
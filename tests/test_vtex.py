@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from scrapers import vtex
+
+
+def _item(pid, slug, price):
+    return {"productId": pid, "linkText": slug, "productName": slug,
+            "items": [{"sellers": [{"commertialOffer": {"Price": price, "ListPrice": price}}]}]}
+
+
+def test_scrape_urls_batches_remembered_ids(monkeypatch):
+    catalog = vtex.Catalog("Paris", "https://www.paris.cl", lambda url: url.rstrip("/").split("/")[-1])
+    catalog.remember("https://www.paris.cl/taladro", "1")
+    catalog.remember("https://www.paris.cl/sierra", "2")  # ya no existe con ese productId
+    calls = []
+
+    async def fetch(url, params=None, headers=None):
+        calls.append((url, params))
+        if url.endswith("/search/"):
+            return [_item("1", "taladro", 19990)]
+        slug = url.split("/")[-2]
+        return [_item({"sierra": "22", "lijadora": "3"}[slug], slug, 9990)]
+
+    monkeypatch.setattr(vtex, "fetch", fetch)
+    batch = [("https://www.paris.cl/taladro", "Taladro"), ("https://www.paris.cl/sierra", "Sierra"),
+             ("https://www.paris.cl/lijadora", "Lijadora")]
+    results = asyncio.run(catalog.scrape_urls(batch))
+
+    assert [(r.sku, r.price) for r in results] == [("1", 19990.0), ("22", 9990.0), ("3", 9990.0)]
+    assert calls[0][1][:2] == [("fq", "productId:1"), ("fq", "productId:2")]
+    assert len(calls) == 3  # un lote más scrape_url para el desconocido y el que no apareció
+    assert catalog.sku_for("https://www.paris.cl/sierra") == "22"
+
+
+def test_scrape_urls_raises_when_the_batch_fails(monkeypatch):
+    catalog = vtex.Catalog("Paris", "https://www.paris.cl", lambda url: url.rstrip("/").split("/")[-1])
+    catalog.remember("https://www.paris.cl/taladro", "1")
+
+    async def fetch(url, params=None, headers=None):
+        raise RuntimeError("HTTP 503")
+
+    monkeypatch.setattr(vtex, "fetch", fetch)
+    with pytest.raises(RuntimeError):
+        asyncio.run(catalog.scrape_urls([("https://www.paris.cl/taladro", "Taladro")]))
+
+
+def test_failed_batch_is_left_to_scrape_url(monkeypatch):
+    import main
+    from scrapers import mercadolibre
+
+    async def fetch(url, params=None, headers=None):
+        raise RuntimeError("HTTP 503")
+
+    monkeypatch.setattr(mercadolibre, "fetch", fetch)
+    products = [{"id": 1, "name": "Taladro", "urls": {"mercadolibre": "https://articulo.mercadolibre.cl/MLC-123-taladro"}}]
+    # Sin nada prefetched, scrape_product pide cada URL por scrape_url
+    assert asyncio.run(main.scrape_batches(products, main.ScrapeRun())) == {}
@@ -0,0 +1,183 @@
+import os
+import time
+import socket
+import asyncio
+import logging
+import multiprocessing
+from datetime import date
+from pathlib import Path
+from scrapers import STORES, client, ratelimit
+from sink import PriceSink
+import main
+import db
+
+log = logging.getLogger(__name__)
+
+# Procesos que scrapean un mismo run; cada uno es un event loop propio (un core) que toma
+# tareas (producto, tienda) de la cola scrape_tasks + scrape_leases
+WORKERS = int(os.environ.get("SCRAPE_WORKERS", os.cpu_count() or 1))
+# Tareas por lease y segundos que un worker las retiene; si muere con ellas vuelven a la cola
+LEASE_TASKS = int(os.environ.get("WORKER_LEASE_TASKS", 40))
+LEASE_SECONDS = float(os.environ.get("WORKER_LEASE_SECONDS", 300))
+MAX_LEASES = int(os.environ.get("WORKER_MAX_LEASES", 3))
+# Segundos entre intentos cuando lo que queda está tomado por otros workers
+POLL_INTERVAL = float(os.environ.get("WORKER_POLL_INTERVAL", 1))
+
+
+async def _work(run_id: int, workers: int, crawl_listings: bool) -> dict:
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    # Los límites por tienda son por proceso: se reparten para que el total no cambie
+    ratelimit.share(workers)
+    limits = {key: max(1, n // workers) for key, n in main.store_limits().items()}
+    run = main.ScrapeRun(store_sems={key: asyncio.Semaphore(n) for key, n in limits.items()})
+    product_sem = asyncio.Semaphore(main.PRODUCT_CONCURRENCY)
+    products = {p["id"]: p for p in main.load_products()}
+    stats = {"owner": owner, "leases": 0, "tasks": 0, "products": 0, "prices": 0, "errors": 0}
+
+    async def scrape_one(product: dict) -> tuple[int, int]:
+        async with product_sem:
+            return await main.scrape_to_sink(product, run, run_id, sink)
+
+    sink = PriceSink()
+    async with client.session(warm=[m.BASE_URL for m in STORES.values()]), sink:
+        while True:
+            run.tasks = db.lease_tasks(run_id, owner, LEASE_TASKS, LEASE_SECONDS, MAX_LEASES)
+            if not run.tasks:
+                if not db.leased_tasks(run_id):
+                    break
+                # Lo pendiente lo tienen otros workers (o el sink propio todavía no lo escribió)
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            run.prefetched = {}
+            stats["leases"] += 1
+            stats["tasks"] += sum(len(keys) for keys in run.tasks.values())
+            batch = [products[pid] for pid in run.tasks if pid in products]
+            # Lo que ya no se puede correr (producto desactivado, URL borrada) va a error, no a la cola
+            main.close_stale_tasks(run_id, run.tasks, batch, run)
+            if crawl_listings:
+                run.prefetched = main.match_listings(batch, run)
+            if main.BATCH_ENABLED:
+                run.prefetched.update(await main.scrape_batches(batch, run))
+            outcomes = await asyncio.gather(*(scrape_one(p) for p in batch), return_exceptions=True)
+            for product, outcome in zip(batch, outcomes):
+                if isinstance(outcome, Exception):
+                    # Sus tareas siguen pendientes: vuelven a la cola cuando venza el lease
+                    log.error(f"  Error en {product['name']}: {outcome}")
+                    stats["errors"] += 1
+                else:
+                    stats["products"] += 1
+                    stats["prices"] += outcome[0]
+                    stats["errors"] += outcome[1]
+    stats["requests_saved"] = run.flights.saved
+    stats["writes"] = sink.stats()
+    return stats
+
+
+def work(run_id: int, workers: int, crawl_listings: bool, db_path: str, results):
+    """Cuerpo de cada proceso worker: toma tareas del run hasta que no quede ninguna libre y
+    deja su resumen en `results`."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    db.DB_PATH = Path(db_path)
+    try:
+        results.put(asyncio.run(_work(run_id, workers, crawl_listings)))
+    except Exception as e:
+        log.error(f"Worker terminó con error: {e}", exc_info=True)
+        results.put({"owner": f"{socket.gethostname()}:{os.getpid()}", "error": str(e)})
+    finally:
+        db.close()
+
+
+async def _crawl(products: list[dict], run: main.ScrapeRun) -> dict:
+    async with client.session():
+        _, summary = await main.crawl(products, run)
+    return summary
+
+
+def run_workers(workers: int = WORKERS, refresh_resolutions: bool = False, resume: bool = False,
+                only_failed: bool = False, due: bool = False, budget: int = None,
+                crawl_listings: bool = None) -> dict:
+    """Como main.run_all, pero con `workers` procesos que toman las tareas del run con lease. Devuelve el
+    mismo resumen más el detalle por worker."""
+    db.init()
+    products = main.load_products(refresh_resolutions)
+    if not products:
+        log.warning("No hay productos configurados")
+        return {"scraped": 0, "prices": 0, "errors": 0}
+
+    run = main.ScrapeRun(store_sems={key: asyncio.Semaphore(n) for key, n in main.store_limits().items()})
+    run_id, mode, agenda = main.open_run(products, run, resume, only_failed, due, budget)
+    if run_id is None:
+        log.info("No hay tareas para correr")
+        return {"scraped": 0, "prices": 0, "errors": 0, "run_id": None, "mode": mode, "schedule": agenda}
+
+    started = time.monotonic()
+    crawl_listings = main.CRAWL_ENABLED if crawl_listings is None else crawl_listings
+    crawled = asyncio.run(_crawl(products, run)) if crawl_listings else None
+
+    log.info(f"Run {run_id} ({mode}) con {workers} workers")
+    # spawn: cada worker arranca limpio, sin heredar la conexión SQLite ni threads de este proceso.
+    # Procesos sueltos y no un pool: si uno muere, los demás siguen y toman sus tareas al vencer el lease
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.SimpleQueue()
+    procs = [ctx.Process(target=work, args=(run_id, workers, crawl_listings, str(db.DB_PATH), queue),
+                         name=f"worker-{i + 1}") for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    results = []
+    while not queue.empty():
+        results.append(queue.get())
+    dead = [proc.name for proc in procs if proc.exitcode]
+    if dead:
+        log.error(f"Workers terminados sin resumen: {', '.join(dead)}")
+
+    run_status = db.finish_run(run_id)
+    elapsed = time.monotonic() - started
+    scraped = db.run_products(run_id)  # un producto puede repartirse entre leases de varios workers
+    tasks = sum(r.get("tasks", 0) for r in results)
+    log.info(f"{scraped} productos ({tasks} tareas) en {elapsed:.1f}s con {workers} workers; "
+             f"run {run_id}: {run_status}")
+    summary = {
+        "run_id": run_id,
+        "mode": mode,
+        "run_status": run_status,
+        "workers": workers,
+        "scraped": scraped,
+        "prices": sum(r.get("prices", 0) for r in results),
+        "errors": sum(r.get("errors", 0) for r in results),
+        "date": str(date.today()),
+        "elapsed_s": round(elapsed, 2),
+        "tasks_per_sec": round(tasks / elapsed, 2) if elapsed > 0 else 0.0,
+        "per_worker": results,
+        "dead_workers": dead,
+        "stores": db.get_run_stats(run_id),
+    }
+    if agenda:
+        summary["schedule"] = agenda
+    if crawled:
+        summary["crawl"] = crawled
+    if main.PRUNE_AFTER_RUN:
+        try:
+            summary["retention"] = db.prune_history()
+        except Exception as e:
+            log.error(f"Falló la retención del historial: {e}")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Corre el scraping de RetailScope en varios procesos")
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS, help=f"Procesos (default {WORKERS})")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--resume", action="store_true", help="Retoma el último run que no terminó")
+    group.add_argument("--failed", action="store_true", help="Reintenta solo las tareas con error del último run")
+    group.add_argument("--due", action="store_true", help="Solo lo que vence según la agenda (scheduler.py)")
+    parser.add_argument("--budget", type=int, help="Máximo de tareas con --due")
+    parser.add_argument("--crawl", action="store_true", help="Recorre primero los listados (CRAWL_TARGETS)")
+    parser.add_argument("--refresh", action="store_true", help="Vuelve a buscar las URLs resueltas por search_query")
+    args = parser.parse_args()
+    print(run_workers(args.workers, refresh_resolutions=args.refresh, resume=args.resume, only_failed=args.failed,
+                      due=args.due, budget=args.budget, crawl_listings=args.crawl or None))